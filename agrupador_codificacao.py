@@ -0,0 +1,86 @@
+# Arquivo: agrupador_codificacao.py
+
+import time
+import threading
+
+class _PedidoCodificacao:
+    def __init__(self, textos):
+        self.textos = textos
+        self.retirado = False
+        self.pronto = False
+        self.vetores = None
+        self.erro = None
+
+class AgrupadorCodificacao:
+    """Junta pedidos de encode de várias threads em uma única chamada ao modelo.
+
+    A primeira thread que encontra o encoder livre vira a "líder": espera até max_espera
+    segundos (ou até juntar max_lote textos), codifica tudo de uma vez e devolve a cada
+    thread as suas linhas. Enquanto o encode roda, os pedidos novos se acumulam para o
+    próximo lote. Sem concorrência (o último lote teve um pedido só), a líder não espera.
+    """
+
+    def __init__(self, funcao_encode, max_espera=0.005, max_lote=64):
+        self.funcao_encode = funcao_encode
+        self.max_espera = max_espera
+        self.max_lote = max_lote
+        self._condicao = threading.Condition()
+        self._pendentes = []
+        self._textos_pendentes = 0
+        self._tem_lider = False
+        self._houve_concorrencia = False
+        self.lotes = 0
+        self.textos_codificados = 0
+
+    def _retirar_lote(self):
+        lote, total = [], 0
+        while self._pendentes and (not lote or total + len(self._pendentes[0].textos) <= self.max_lote):
+            pedido = self._pendentes.pop(0)
+            pedido.retirado = True
+            lote.append(pedido)
+            total += len(pedido.textos)
+        self._textos_pendentes -= total
+        return lote
+
+    def _executar(self, lote):
+        textos = [texto for pedido in lote for texto in pedido.textos]
+        try:
+            vetores, erro = self.funcao_encode(textos), None
+        except Exception as e:
+            vetores, erro = None, e
+        with self._condicao:
+            inicio = 0
+            for pedido in lote:
+                if vetores is not None:
+                    pedido.vetores = vetores[inicio:inicio + len(pedido.textos)]
+                pedido.erro = erro
+                pedido.pronto = True
+                inicio += len(pedido.textos)
+            self.lotes += 1
+            self.textos_codificados += len(textos)
+            self._houve_concorrencia = len(lote) > 1 or bool(self._pendentes)
+            self._tem_lider = False
+            self._condicao.notify_all()
+
+    def codificar(self, textos):
+        pedido = _PedidoCodificacao(list(textos))
+        with self._condicao:
+            self._pendentes.append(pedido)
+            self._textos_pendentes += len(pedido.textos)
+            self._condicao.notify_all()
+        while True:
+            with self._condicao:
+                while not pedido.pronto and (pedido.retirado or self._tem_lider):
+                    self._condicao.wait()
+                if pedido.pronto: break
+                self._tem_lider = True
+                prazo = time.monotonic() + (self.max_espera if self._houve_concorrencia else 0)
+                while self._textos_pendentes < self.max_lote:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0: break
+                    self._condicao.wait(restante)
+                lote = self._retirar_lote()
+            self._executar(lote)
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.vetores
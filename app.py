@@ -2,15 +2,14 @@
 
 import streamlit as st
 import os
-import subprocess
 import time
-import sys
-import shutil
 from datetime import datetime
 from dotenv import load_dotenv
 import requests
 import zipfile
 from io import BytesIO
+from artefatos import versao_atual
+from fila_treinamento import solicitar_treinamento, descrever_estado_treinamento
 
 # --- LÓGICA DE DOWNLOAD DOS MODELOS (RESOLVE O PROBLEMA DE DEPLOY) ---
 @st.cache_resource
@@ -20,11 +19,15 @@ def setup_model_files():
     O decorador @st.cache_resource garante que isto só seja executado uma vez por sessão.
     """
     # Lista de arquivos essenciais que a aplicação precisa para funcionar
-    arquivos_essenciais = [
-        'layout_embeddings.joblib', 
-        'layout_labels.joblib', 
-        'layouts_meta.json'
-    ]
+    arquivos_essenciais = ['layouts_meta.json']
+    if versao_atual():
+        # Versão publicada pelo treinador em modelos/: o ponteiro só existe com a versão completa.
+        arquivos_essenciais = []
+    elif os.path.exists('layout_index.bin'):
+        arquivos_essenciais += ['layout_index.bin', 'layout_index.bin.labels.json']
+    else:
+        # Pacote de modelos no formato antigo (pickle)
+        arquivos_essenciais += ['layout_embeddings.joblib', 'layout_labels.joblib']
     # O vectorizer é parte do modelo antigo, pode ser opcional dependendo da versão
     if os.path.exists('vectorizer.joblib'):
         arquivos_essenciais.append('vectorizer.joblib')
@@ -64,19 +67,25 @@ setup_model_files()
 
 # --- CARREGAMENTO DE SEGREDOS E O RESTO DA APLICAÇÃO ---
 # Importa o cérebro DEPOIS de a configuração estar pronta
-from identificador import identificar_layout, recarregar_modelo, extrair_texto_do_arquivo
+from identificador import extrair_documento, hash_do_conteudo, gravar_documento_no_cache
+from cliente_inferencia import identificar_layout, recarregar_modelo, iniciar_aquecimento, estado_do_modelo
+import metricas
 
 caminho_secrets = os.path.join(".streamlit", "secrets.toml")
 if os.path.exists(caminho_secrets):
     load_dotenv(dotenv_path=caminho_secrets)
     print("Arquivo de segredos do Streamlit carregado para o ambiente.")
 
+# O modelo carrega em segundo plano (ou fica no servidor de inferência); a interface já pode ser exibida enquanto isso.
+iniciar_aquecimento()
+metricas.definir_processo('app')
+metricas.iniciar_servidor_metricas()
+
 # --- Configurações Iniciais ---
-TEMP_DIR = "temp_files"
 TRAIN_DIR = "arquivos_de_treinamento"
 MAP_FILE = "mapeamento_layouts.xlsx"
 CACHE_DIR = "cache_de_texto"
-for folder in [TEMP_DIR, TRAIN_DIR, CACHE_DIR]:
+for folder in [TRAIN_DIR, CACHE_DIR]:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
@@ -90,32 +99,35 @@ with col_logo2:
 st.title("IA identificadora de Layouts 🤖")
 
 # --- Funções de Apoio ---
-def analisar_arquivo(caminho_arquivo, sistema=None, descricao=None, tipo_relatorio=None, senha=None):
+def analisar_arquivo(conteudo, nome_arquivo, sistema=None, descricao=None, tipo_relatorio=None, senha=None):
+    # O upload fica só na memória da sessão; a extensão do nome original define como ele é lido.
     st.session_state.resultados = identificar_layout(
-        caminho_arquivo, 
+        conteudo, 
         sistema_alvo=sistema, 
         descricao_adicional=descricao,
         tipo_relatorio_alvo=tipo_relatorio,
-        senha_manual=senha
+        senha_manual=senha,
+        extensao=nome_arquivo
     )
     st.session_state.senha_incorreta = (st.session_state.resultados == "SENHA_INCORRETA")
     st.session_state.senha_necessaria = (st.session_state.resultados == "SENHA_NECESSARIA")
     st.session_state.analise_feita = True
 
 def confirmar_e_retreinar(codigo_correto):
-    if st.session_state.caminho_arquivo_temp and os.path.exists(st.session_state.caminho_arquivo_temp):
+    if st.session_state.conteudo_arquivo:
+        # Só a confirmação grava o arquivo em disco, já como arquivo de treinamento.
+        conteudo = st.session_state.conteudo_arquivo
         nome_original = st.session_state.nome_arquivo_original
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         novo_nome_base = f"{codigo_correto}_confirmed_{timestamp}_{nome_original}"
-        caminho_destino = os.path.join(TRAIN_DIR, novo_nome_base)
-        shutil.copy(st.session_state.caminho_arquivo_temp, caminho_destino)
-        texto_novo = extrair_texto_do_arquivo(caminho_destino)
-        if texto_novo:
-            caminho_cache = os.path.join(CACHE_DIR, novo_nome_base + '.txt')
-            with open(caminho_cache, 'w', encoding='utf-8') as f:
-                f.write(texto_novo)
-        st.info(f"O layout '{codigo_correto}' foi reforçado. Iniciando retreinamento rápido...")
-        subprocess.Popen([sys.executable, 'treinador_em_massa.py', '--retreinar-rapido'])
+        with open(os.path.join(TRAIN_DIR, novo_nome_base), "wb") as f:
+            f.write(conteudo)
+        documento = extrair_documento(conteudo, extensao=nome_original)
+        if isinstance(documento, dict) and documento['texto']:
+            gravar_documento_no_cache(CACHE_DIR, codigo_correto, hash_do_conteudo(conteudo), documento)
+        # Confirmações seguidas são agrupadas num único retreinamento rápido.
+        solicitar_treinamento('rapido')
+        st.info(f"O layout '{codigo_correto}' foi reforçado. Retreinamento rápido agendado.")
     else:
         st.error("Nenhum ficheiro válido para confirmar.")
 
@@ -124,12 +136,19 @@ if 'analise_feita' not in st.session_state: st.session_state.analise_feita = Fal
 if 'resultados' not in st.session_state: st.session_state.resultados = None
 if 'senha_necessaria' not in st.session_state: st.session_state.senha_necessaria = False
 if 'senha_incorreta' not in st.session_state: st.session_state.senha_incorreta = False
-if 'caminho_arquivo_temp' not in st.session_state: st.session_state.caminho_arquivo_temp = ""
+if 'conteudo_arquivo' not in st.session_state: st.session_state.conteudo_arquivo = b""
 if 'nome_arquivo_original' not in st.session_state: st.session_state.nome_arquivo_original = ""
 if 'authenticated' not in st.session_state: st.session_state.authenticated = False
 
 # --- PAINEL DE ADMIN NA SIDEBAR ---
 st.sidebar.title("Painel de Administração")
+ESTADOS_MODELO = {
+    "pronto": "🟢 Modelo pronto",
+    "carregando": "🟡 Modelo a carregar em segundo plano...",
+    "indisponivel": "🔴 Modelo indisponível",
+    "nao_carregado": "⚪ Modelo ainda não carregado",
+}
+st.sidebar.caption(ESTADOS_MODELO.get(estado_do_modelo(), estado_do_modelo()))
 if not st.session_state.authenticated:
     username_input = st.sidebar.text_input("Utilizador", key="username")
     password_input = st.sidebar.text_input("Senha", type="password", key="password")
@@ -157,8 +176,11 @@ if st.session_state.authenticated:
         st.sidebar.success(f"{len(uploaded_training_files)} ficheiro(s) salvos.")
     st.sidebar.header("Gerenciamento do Modelo")
     if st.sidebar.button("Iniciar Retreinamento do Modelo"):
-        st.sidebar.info("O treinamento foi iniciado em segundo plano...")
-        subprocess.Popen([sys.executable, 'treinador_em_massa.py'])
+        solicitar_treinamento('completo')
+        st.sidebar.info("O treinamento foi agendado em segundo plano...")
+    st.sidebar.caption(descrever_estado_treinamento())
+    if st.sidebar.button("Atualizar Estado do Treinamento"):
+        st.rerun()
     if st.sidebar.button("Recarregar Modelo na Aplicação"):
         with st.spinner("A recarregar modelo..."):
             if recarregar_modelo():
@@ -186,15 +208,12 @@ with st.form(key="search_form"):
 if submitted:
     if uploaded_file is not None:
         with st.spinner('A analisar novo ficheiro...'):
-            caminho_arquivo = os.path.join(TEMP_DIR, uploaded_file.name)
-            with open(caminho_arquivo, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            st.session_state.caminho_arquivo_temp = caminho_arquivo
+            st.session_state.conteudo_arquivo = uploaded_file.getvalue()
             st.session_state.nome_arquivo_original = uploaded_file.name
-            analisar_arquivo(caminho_arquivo, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input)
-    elif st.session_state.caminho_arquivo_temp:
+            analisar_arquivo(st.session_state.conteudo_arquivo, uploaded_file.name, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input)
+    elif st.session_state.conteudo_arquivo:
         with st.spinner(f"A refazer busca para '{st.session_state.nome_arquivo_original}'..."):
-            analisar_arquivo(st.session_state.caminho_arquivo_temp, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input)
+            analisar_arquivo(st.session_state.conteudo_arquivo, st.session_state.nome_arquivo_original, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input)
     else:
         st.warning("Por favor, selecione um ficheiro para analisar.")
 
@@ -205,7 +224,7 @@ if st.session_state.senha_necessaria:
     if st.button("Tentar novamente"):
         if senha_manual:
             with st.spinner('A analisar...'):
-                analisar_arquivo(st.session_state.caminho_arquivo_temp, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input, senha=senha_manual)
+                analisar_arquivo(st.session_state.conteudo_arquivo, st.session_state.nome_arquivo_original, sistema=sistema_input, descricao=descricao_input, tipo_relatorio=tipo_relatorio_input, senha=senha_manual)
                 st.rerun()
 elif st.session_state.senha_incorreta:
     st.error("A senha manual está incorreta.")
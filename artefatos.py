@@ -0,0 +1,84 @@
+# Arquivo: artefatos.py
+
+import os
+import shutil
+from datetime import datetime
+
+# Cada treinamento publica uma pasta completa e imutável em modelos/<versão>/ e só então troca o
+# ponteiro modelos/ATUAL (escrita atômica). Quem serve lê sempre os arquivos de uma única versão.
+# Sem ponteiro (instalações antigas), os arquivos soltos na raiz do projeto continuam valendo.
+DIRETORIO_ATUAL = os.path.dirname(os.path.abspath(__file__))
+PASTA_MODELOS = os.path.join(DIRETORIO_ATUAL, 'modelos')
+ARQUIVO_PONTEIRO = os.path.join(PASTA_MODELOS, 'ATUAL')
+ARQUIVO_VERSAO_MODELO = os.path.join(DIRETORIO_ATUAL, 'model_version.txt')
+PREFIXO_PREPARACAO = '.preparando-'
+VERSOES_MANTIDAS = 3
+
+NOME_INDICE = 'layout_index.bin'
+NOME_LABELS = NOME_INDICE + '.labels.json'
+NOME_METADADOS = 'layouts_meta.json'
+NOME_MANIFESTO = 'layout_manifest.json'
+NOME_IVF = NOME_INDICE + '.ivf' # opcional: só existe em catálogos grandes
+ARQUIVOS_DA_VERSAO = [NOME_INDICE, NOME_LABELS, NOME_IVF, NOME_METADADOS, NOME_MANIFESTO]
+ARQUIVOS_DO_INDICE = [NOME_INDICE, NOME_LABELS, NOME_IVF, NOME_MANIFESTO] # gerados juntos, a cada treinamento
+
+def versao_atual():
+    try:
+        with open(ARQUIVO_PONTEIRO, 'r', encoding='utf-8') as f:
+            versao = f.read().strip()
+    except OSError:
+        return None
+    return versao if versao and os.path.isdir(os.path.join(PASTA_MODELOS, versao)) else None
+
+def caminhos_da_versao(versao=None):
+    """Caminhos dos artefatos da versão (a atual, por padrão), ou os da raiz se não houver versão publicada."""
+    versao = versao or versao_atual()
+    pasta = os.path.join(PASTA_MODELOS, versao) if versao else DIRETORIO_ATUAL
+    return versao, {nome: os.path.join(pasta, nome) for nome in ARQUIVOS_DA_VERSAO}
+
+def preparar_versao():
+    versao = datetime.now().strftime('%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+    pasta = os.path.join(PASTA_MODELOS, PREFIXO_PREPARACAO + versao)
+    os.makedirs(pasta)
+    return versao, pasta
+
+def _herdar_arquivos(pasta_preparada):
+    # O que a nova versão não trouxe (ex.: só os metadados mudaram) vem da versão atual, por hard link quando possível.
+    _, anteriores = caminhos_da_versao()
+    indice_novo = os.path.exists(os.path.join(pasta_preparada, NOME_INDICE))
+    for nome in ARQUIVOS_DA_VERSAO:
+        destino = os.path.join(pasta_preparada, nome)
+        if os.path.exists(destino) or not os.path.exists(anteriores[nome]): continue
+        if indice_novo and nome in ARQUIVOS_DO_INDICE: continue # nada derivado do índice anterior acompanha um índice novo
+        try:
+            os.link(anteriores[nome], destino)
+        except OSError:
+            shutil.copy2(anteriores[nome], destino)
+
+def _gravar_atomico(caminho, conteudo):
+    caminho_temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(caminho_temporario, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(caminho_temporario, caminho)
+
+def publicar_versao(versao, pasta_preparada):
+    _herdar_arquivos(pasta_preparada)
+    faltando = [nome for nome in (NOME_INDICE, NOME_LABELS, NOME_METADADOS) if not os.path.exists(os.path.join(pasta_preparada, nome))]
+    if faltando:
+        shutil.rmtree(pasta_preparada, ignore_errors=True)
+        raise RuntimeError(f"Versão {versao} incompleta, faltando: {', '.join(faltando)}.")
+    os.replace(pasta_preparada, os.path.join(PASTA_MODELOS, versao))
+    _gravar_atomico(ARQUIVO_PONTEIRO, versao)
+    _gravar_atomico(ARQUIVO_VERSAO_MODELO, versao)
+    print(f"Versão do modelo publicada: {versao}")
+    limpar_versoes_antigas()
+
+def limpar_versoes_antigas(manter=VERSOES_MANTIDAS):
+    atual = versao_atual()
+    versoes = sorted(nome for nome in os.listdir(PASTA_MODELOS) if os.path.isdir(os.path.join(PASTA_MODELOS, nome)) and not nome.startswith('.'))
+    for versao in versoes[:-manter] if manter else versoes:
+        if versao == atual: continue
+        # Um processo que ainda serve a versão antiga mantém o índice mapeado; no Windows a remoção falha e fica para a próxima.
+        shutil.rmtree(os.path.join(PASTA_MODELOS, versao), ignore_errors=True)
@@ -0,0 +1,380 @@
+# Arquivo: benchmark.py
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import fitz
+import pytesseract
+from openpyxl import Workbook
+from PIL import Image, ImageDraw
+
+import identificador
+import cliente_manager
+import artefatos
+from indice_embeddings import IndiceEmbeddings, IndiceIVF, caminho_ivf, normalizar_linhas
+from codificador import carregar_codificador
+
+# Benchmark offline por etapa (extração, OCR, encode, pontuação e ponta a ponta) com documentos e
+# catálogo de layouts sintéticos. A API do Manager é simulada; nada sai da máquina.
+ARQUIVO_BASELINE = 'benchmark_baseline.json'
+TOLERANCIA_PADRAO = 0.25 # etapa 25% mais lenta que a baseline (mediana) conta como regressão
+DIMENSOES_SINTETICAS = 512
+SEMENTE = 42
+BANCOS = ['Banco do Brasil', 'Itaú', 'Bradesco', 'Santander', 'Caixa', 'Sicoob', 'Sicredi', 'Inter', 'Nubank', 'Banrisul']
+SISTEMAS = ['Dominio', 'SCI', 'Prosoft', 'Alterdata', 'Questor']
+TIPOS_RELATORIO = ['Bancário', 'Financeiro']
+VOCABULARIO = ('extrato conta corrente agencia periodo saldo anterior historico documento valor credito debito '
+               'tarifa pacote servicos pix recebido enviado ted doc boleto pago liquidacao cobranca aplicacao resgate '
+               'rendimento juros multa desconto fornecedor cliente vencimento emissao parcela titulo nota fiscal razao '
+               'analitico lancamento contabil movimento caixa fluxo realizado previsto entradas saidas conciliacao').split()
+FORMATOS = {'pdf_texto': '.pdf', 'pdf_imagem': '.pdf', 'xlsx': '.xlsx', 'csv': '.csv', 'xml': '.xml'}
+
+class CodificadorSintetico:
+    """Encoder determinístico (hash de palavras), para medir o resto do pipeline sem o modelo."""
+    backend = 'sintetico'
+    identificacao = 'sintetico-hash'
+
+    def codificar(self, textos, batch_size=32, mostrar_progresso=False):
+        embeddings = np.zeros((len(textos), DIMENSOES_SINTETICAS), dtype=np.float32)
+        for linha, texto in enumerate(textos):
+            for palavra in re.findall(r'\w+', texto.lower()):
+                embeddings[linha, zlib.crc32(palavra.encode('utf-8')) % DIMENSOES_SINTETICAS] += 1.0
+        normas = np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings / normas
+
+class _RespostaFalsa:
+    status_code = 200
+
+    def __init__(self, dados):
+        self._dados = dados
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._dados
+
+class ApiManagerFalsa:
+    """Sessão HTTP falsa: responde ao get-token e à lista de layouts como a API do Manager."""
+
+    def __init__(self, layouts):
+        self.layouts = layouts
+        self.chamadas = 0
+
+    def post(self, url, **kwargs):
+        self.chamadas += 1
+        return _RespostaFalsa({'data': {'access_token': 'token-benchmark'}})
+
+    def get(self, url, **kwargs):
+        self.chamadas += 1
+        return _RespostaFalsa({'data': self.layouts})
+
+@contextlib.contextmanager
+def substituir(objeto, **atributos):
+    originais = {nome: getattr(objeto, nome) for nome in atributos}
+    for nome, valor in atributos.items():
+        setattr(objeto, nome, valor)
+    try:
+        yield
+    finally:
+        for nome, valor in originais.items():
+            setattr(objeto, nome, valor)
+
+# --- GERADOR DE CATÁLOGO E DOCUMENTOS ---
+def gerar_catalogo(rng, quantidade):
+    layouts = []
+    for i in range(quantidade):
+        formato = list(FORMATOS)[i % len(FORMATOS)]
+        banco = BANCOS[i % len(BANCOS)]
+        layouts.append({
+            'codigo_layout': str(1000 + i),
+            'formato': identificador.normalizar_extensao(FORMATOS[formato].lstrip('.')),
+            'tipo_gerador': formato,
+            'sistema': SISTEMAS[i % len(SISTEMAS)],
+            'tipo_relatorio': TIPOS_RELATORIO[i % len(TIPOS_RELATORIO)],
+            'descricao': f"{banco} - Extrato modelo {i}",
+            'cabecalho': f"{banco} AG{rng.randint(1000, 9999)} CC{rng.randint(10000, 99999)} {' '.join(rng.sample(VOCABULARIO, 12))}",
+            'colunas': rng.sample(VOCABULARIO, 5),
+            'historicos': rng.sample(VOCABULARIO, 8), # cada banco usa o seu conjunto de históricos
+        })
+    return layouts
+
+def linhas_do_documento(rng, layout, quantidade):
+    linhas = [layout['cabecalho'], " ".join(layout['colunas'])]
+    saldo = rng.uniform(1000, 50000)
+    for _ in range(quantidade):
+        valor = rng.uniform(-5000, 5000)
+        saldo += valor
+        historico = " ".join(rng.sample(layout['historicos'], 3)).upper()
+        linhas.append(f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d} {historico} {rng.randint(100000, 999999)} {valor:.2f} {saldo:.2f}")
+    return linhas
+
+def _paginas(linhas, linhas_por_pagina):
+    return [linhas[i:i + linhas_por_pagina] for i in range(0, len(linhas), linhas_por_pagina)]
+
+def gerar_pdf_texto(caminho, linhas, linhas_por_pagina=60):
+    doc = fitz.open()
+    for pagina_linhas in _paginas(linhas, linhas_por_pagina):
+        doc.new_page().insert_text((40, 40), "\n".join(pagina_linhas), fontsize=8)
+    doc.save(caminho)
+    doc.close()
+
+def imagem_de_texto(linhas, largura=1240):
+    imagem = Image.new('L', (largura, 20 * len(linhas) + 40), color=255)
+    desenho = ImageDraw.Draw(imagem)
+    for i, linha in enumerate(linhas):
+        desenho.text((20, 20 + 20 * i), linha, fill=0)
+    buffer = io.BytesIO()
+    imagem.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def gerar_pdf_imagem(caminho, linhas, linhas_por_pagina=40):
+    doc = fitz.open()
+    for pagina_linhas in _paginas(linhas, linhas_por_pagina):
+        pagina = doc.new_page()
+        pagina.insert_image(pagina.rect, stream=imagem_de_texto(pagina_linhas))
+    doc.save(caminho)
+    doc.close()
+
+def gerar_xlsx(caminho, linhas):
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet("Extrato")
+    for linha in linhas:
+        aba.append(linha.split())
+    planilha.save(caminho)
+
+def gerar_csv(caminho, linhas):
+    with open(caminho, 'w', encoding='cp1252', newline='') as f:
+        f.write("\n".join(";".join(linha.split()) for linha in linhas) + "\n")
+
+def gerar_xml(caminho, linhas):
+    partes = ['<?xml version="1.0" encoding="UTF-8"?>', '<extrato>', f"<cabecalho>{linhas[0]}</cabecalho>"]
+    partes += [f"<lancamento>{linha}</lancamento>" for linha in linhas[1:]]
+    partes.append('</extrato>')
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write("\n".join(partes))
+
+GERADORES = {'pdf_texto': gerar_pdf_texto, 'pdf_imagem': gerar_pdf_imagem, 'xlsx': gerar_xlsx, 'csv': gerar_csv, 'xml': gerar_xml}
+
+def gerar_documentos(rng, pasta, catalogo, linhas_por_documento, documentos_por_formato):
+    documentos = []
+    for tipo, extensao in FORMATOS.items():
+        candidatos = [layout for layout in catalogo if layout['tipo_gerador'] == tipo]
+        for n in range(min(documentos_por_formato, len(candidatos))):
+            layout = candidatos[n]
+            caminho = os.path.join(pasta, f"{tipo}_{n}{extensao}")
+            GERADORES[tipo](caminho, linhas_do_documento(rng, layout, linhas_por_documento))
+            documentos.append({'tipo': tipo, 'caminho': caminho, 'esperado': layout['codigo_layout']})
+    return documentos
+
+def gravar_catalogo(rng, pasta, catalogo, codificador):
+    # Cada layout ganha os trechos de um documento de exemplo, como o treinador faria a partir do cache.
+    labels, trechos = [], []
+    for layout in catalogo:
+        for trecho in identificador.dividir_em_trechos(" ".join(linhas_do_documento(rng, layout, 40))):
+            labels.append(layout['codigo_layout'])
+            trechos.append(trecho)
+    caminho_indice = os.path.join(pasta, artefatos.NOME_INDICE)
+    IndiceEmbeddings.de_matriz(codificador.codificar(trechos), labels).salvar(caminho_indice)
+    caminho_metadados = os.path.join(pasta, artefatos.NOME_METADADOS)
+    with open(caminho_metadados, 'w', encoding='utf-8') as f:
+        json.dump([{chave: valor for chave, valor in layout.items() if chave not in ('tipo_gerador', 'colunas', 'historicos')} for layout in catalogo], f, ensure_ascii=False)
+    return len(trechos)
+
+# --- MEDIÇÃO ---
+def medir(funcao, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar: preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'mediana_ms': round(float(np.median(tempos)), 3),
+        'p95_ms': round(float(np.percentile(tempos, 95)), 3),
+        'amostras': repeticoes,
+    }
+
+def tesseract_disponivel():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def _imagens_do_pdf(caminho):
+    with fitz.open(caminho) as doc:
+        imagens = [doc.extract_image(xref)['image'] for pagina in doc for xref, *_ in pagina.get_images(full=True)]
+    return {hashlib.sha1(imagem).hexdigest(): imagem for imagem in imagens}
+
+def executar_benchmark(args):
+    rng = random.Random(SEMENTE)
+    codificador = CodificadorSintetico() if args.codificador == 'sintetico' else carregar_codificador(args.codificador)
+    tem_ocr = tesseract_disponivel()
+    if not tem_ocr:
+        print("AVISO: Tesseract não encontrado. As etapas de OCR e o PDF escaneado serão ignorados.", file=sys.stderr)
+    etapas = {}
+    pasta = tempfile.mkdtemp(prefix="benchmark_")
+    pasta_ocr = os.path.join(pasta, 'cache_ocr')
+    try:
+        print(f"Gerando catálogo sintético com {args.layouts} layouts...", file=sys.stderr)
+        catalogo = gerar_catalogo(rng, args.layouts)
+        total_trechos = gravar_catalogo(rng, pasta, catalogo, codificador)
+        documentos = gerar_documentos(rng, pasta, catalogo, args.linhas, args.documentos)
+        if not tem_ocr:
+            documentos = [doc for doc in documentos if doc['tipo'] != 'pdf_imagem']
+        api_falsa = ApiManagerFalsa([{'codigo': layout['codigo_layout'], 'imagem': f"https://exemplo.invalid/{layout['codigo_layout']}.jpg"} for layout in catalogo])
+
+        def limpar_caches():
+            identificador.CACHE_TEXTOS.limpar()
+            identificador.CACHE_EMBEDDINGS.limpar()
+            shutil.rmtree(pasta_ocr, ignore_errors=True)
+            os.makedirs(pasta_ocr)
+
+        # O catálogo sintético faz o papel da versão publicada (arquivos soltos na pasta temporária).
+        with substituir(artefatos, DIRETORIO_ATUAL=pasta, PASTA_MODELOS=os.path.join(pasta, 'modelos'), ARQUIVO_PONTEIRO=os.path.join(pasta, 'modelos', 'ATUAL')), \
+             substituir(identificador, PASTA_CACHE_OCR=pasta_ocr, carregar_codificador=lambda: codificador), \
+             substituir(identificador, _MOTOR=None, _CARREGAMENTO_TENTADO=True), \
+             substituir(cliente_manager, _CLIENTE=cliente_manager.ClienteManager(segredo='benchmark', sessao=api_falsa),
+                        ARQUIVO_CACHE_IMAGENS=os.path.join(pasta, 'layouts_imagens.json')):
+            os.environ.setdefault('API_SECRET', 'benchmark')
+            motor_carregado = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                etapas['carregamento'] = medir(lambda: motor_carregado.update(motor=identificador.MotorIdentificacao.carregar()), args.repeticoes)
+            motor = motor_carregado['motor']
+            identificador._MOTOR = motor
+
+            textos = {}
+            for tipo in FORMATOS:
+                docs = [doc for doc in documentos if doc['tipo'] == tipo]
+                if not docs: continue
+                etapas[f'extracao_{tipo}'] = medir(lambda: [textos.__setitem__(doc['caminho'], identificador.extrair_texto_do_arquivo(doc['caminho'])) for doc in docs], args.repeticoes, limpar_caches)
+            if tem_ocr:
+                imagens = {}
+                for doc in documentos:
+                    if doc['tipo'] == 'pdf_imagem': imagens.update(_imagens_do_pdf(doc['caminho']))
+                etapas['ocr'] = medir(lambda: identificador.ocr_imagens(imagens), args.repeticoes, limpar_caches)
+
+            consultas = [identificador.texto_para_busca(textos[doc['caminho']]) for doc in documentos]
+            etapas['codificacao_consulta'] = medir(lambda: motor.codificar(consultas[:1]), args.repeticoes, limpar_caches)
+            etapas['codificacao_lote'] = medir(lambda: motor.codificar(consultas), args.repeticoes, limpar_caches)
+            embedding = motor.codificar(consultas[:1])
+            extensao = identificador._extensao_normalizada(documentos[0]['caminho'])
+            etapas['pontuacao'] = medir(lambda: motor.ranquear(motor.pontuar(embedding)[0] + motor.calcular_bonus(), extensao), args.repeticoes)
+
+            acertos = 0
+            for tipo in FORMATOS:
+                docs = [doc for doc in documentos if doc['tipo'] == tipo]
+                if not docs: continue
+                resultados = {}
+                etapas[f'ponta_a_ponta_{tipo}'] = medir(lambda: [resultados.__setitem__(doc['caminho'], identificador.identificar_layout(doc['caminho'])) for doc in docs], args.repeticoes, limpar_caches)
+                acertos += sum(1 for doc in docs if isinstance(resultados[doc['caminho']], list) and resultados[doc['caminho']]
+                               and resultados[doc['caminho']][0]['codigo_layout'] == doc['esperado'])
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    return {
+        'config': {
+            'layouts': args.layouts, 'trechos_indice': total_trechos, 'linhas_por_documento': args.linhas,
+            'documentos_por_formato': args.documentos, 'codificador': codificador.identificacao, 'ocr': tem_ocr,
+        },
+        'acerto_top1': round(acertos / max(len(documentos), 1), 3),
+        'etapas': etapas,
+    }
+
+# --- BUSCA APROXIMADA ---
+def vetores_de_catalogo_grande(rng, layouts, vetores, consultas, familias=100):
+    # Famílias (banco/sistema) > layouts > vetores por documento: os vizinhos de um layout são os da mesma família.
+    ruido = lambda linhas, escala: rng.standard_normal((linhas, DIMENSOES_SINTETICAS)).astype(np.float32) * escala / np.sqrt(DIMENSOES_SINTETICAS)
+    centros_familias = normalizar_linhas(ruido(familias, np.sqrt(DIMENSOES_SINTETICAS)))
+    centros = normalizar_linhas(centros_familias[rng.integers(0, familias, layouts)] + ruido(layouts, 0.8))
+    labels = rng.integers(0, layouts, vetores)
+    matriz = centros[labels] + ruido(vetores, 1.0)
+    alvos = rng.integers(0, layouts, consultas)
+    return matriz, [str(label) for label in labels], normalizar_linhas(centros[alvos] + ruido(consultas, 1.0))
+
+def medir_busca_aproximada(args, etapas):
+    """recall@k do índice aproximado contra a busca exata, por layout (como identificar_layout ranqueia)."""
+    rng = np.random.default_rng(SEMENTE)
+    matriz, labels, consultas = vetores_de_catalogo_grande(rng, args.ann_layouts, args.ann_vetores, args.ann_consultas)
+    pasta = tempfile.mkdtemp(prefix="benchmark_ann_")
+    try:
+        caminho = os.path.join(pasta, artefatos.NOME_INDICE)
+        IndiceEmbeddings.de_matriz(matriz, labels).salvar(caminho)
+        del matriz
+        indice = IndiceEmbeddings.abrir(caminho)
+        ivf_construido = {}
+        etapas['construcao_ivf'] = medir(lambda: ivf_construido.update(ivf=IndiceIVF.construir(indice)), 1)
+        ivf_construido['ivf'].salvar(caminho_ivf(caminho))
+        indice = IndiceEmbeddings.abrir(caminho)
+        exatos, aproximados = [], []
+        etapas['busca_exata'] = medir(lambda: exatos.append(indice.pontuar_layouts(consultas[len(exatos) % len(consultas)], identificador.AGREGACAO_SCORES)), args.ann_consultas)
+        etapas['busca_aproximada'] = medir(lambda: aproximados.append(indice.pontuar_layouts(consultas[len(aproximados) % len(consultas)], identificador.AGREGACAO_SCORES, args.ann_sondas)), args.ann_consultas)
+        recall = {}
+        for k in (1, identificador.MAX_RESULTADOS):
+            acertos = [len(set(np.argsort(-exato)[:k]) & set(np.argsort(-aproximado)[:k])) / k for exato, aproximado in zip(exatos, aproximados)]
+            recall[f'recall@{k}'] = round(float(np.mean(acertos)), 4)
+        return {'listas': indice.ivf.listas, 'sondas': args.ann_sondas, **recall}
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+def comparar_com_baseline(resultado, baseline, tolerancia):
+    if baseline.get('config') != resultado['config']:
+        print("AVISO: A baseline foi gerada com outra configuração; a comparação é apenas indicativa.")
+    regressoes = []
+    print(f"\n{'etapa':<28}{'baseline':>12}{'atual':>12}{'variação':>11}")
+    for etapa, medida in resultado['etapas'].items():
+        anterior = baseline.get('etapas', {}).get(etapa)
+        if not anterior:
+            print(f"{etapa:<28}{'-':>12}{medida['mediana_ms']:>10.1f}ms{'nova':>11}")
+            continue
+        variacao = medida['mediana_ms'] / max(anterior['mediana_ms'], 1e-9) - 1
+        marcador = "  <- REGRESSÃO" if variacao > tolerancia else ""
+        print(f"{etapa:<28}{anterior['mediana_ms']:>10.1f}ms{medida['mediana_ms']:>10.1f}ms{variacao:>+10.0%}{marcador}")
+        if marcador: regressoes.append(etapa)
+    return regressoes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark offline por etapa do identificador, com documentos e layouts sintéticos.")
+    parser.add_argument('--layouts', type=int, default=500, help="Tamanho do catálogo sintético de layouts.")
+    parser.add_argument('--linhas', type=int, default=200, help="Linhas de lançamentos por documento gerado.")
+    parser.add_argument('--documentos', type=int, default=3, help="Documentos gerados por formato.")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Repetições de cada etapa (reporta mediana e p95).")
+    parser.add_argument('--codificador', choices=['sintetico', 'torch', 'onnx'], default='sintetico', help="Encoder usado: 'sintetico' roda sem o modelo; 'torch'/'onnx' medem o modelo real.")
+    parser.add_argument('--baseline', default=ARQUIVO_BASELINE, help="Arquivo de baseline para comparação.")
+    parser.add_argument('--salvar-baseline', action='store_true', help="Grava o resultado desta execução como nova baseline.")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO, help="Aumento relativo da mediana tolerado antes de acusar regressão.")
+    parser.add_argument('--busca-aproximada', action='store_true', help="Mede também o índice aproximado (IVF) num catálogo grande: recall@k e latência contra a busca exata.")
+    parser.add_argument('--ann-vetores', type=int, default=100000, help="Vetores do catálogo grande sintético.")
+    parser.add_argument('--ann-layouts', type=int, default=2000, help="Layouts do catálogo grande sintético.")
+    parser.add_argument('--ann-consultas', type=int, default=200, help="Consultas usadas no recall@k.")
+    parser.add_argument('--ann-sondas', type=int, default=identificador.N_SONDAS_IVF, help="Listas visitadas por consulta no índice aproximado.")
+    args = parser.parse_args()
+
+    resultado = executar_benchmark(args)
+    if args.busca_aproximada:
+        print(f"Gerando catálogo grande com {args.ann_vetores} vetores para a busca aproximada...", file=sys.stderr)
+        resultado['config'].update({'ann_vetores': args.ann_vetores, 'ann_layouts': args.ann_layouts, 'ann_sondas': args.ann_sondas})
+        resultado['busca_aproximada'] = medir_busca_aproximada(args, resultado['etapas'])
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Baseline salva em '{args.baseline}'.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressoes = comparar_com_baseline(resultado, json.load(f), args.tolerancia)
+        if regressoes:
+            print(f"\nERRO: {len(regressoes)} etapa(s) mais lentas que a baseline: {', '.join(regressoes)}")
+            sys.exit(1)
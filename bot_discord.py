@@ -8,23 +8,26 @@ caminho_script = os.path.dirname(os.path.abspath(__file__))
 caminho_env = os.path.join(caminho_script, '.env')
 load_dotenv(dotenv_path=caminho_env)
 
-from identificador import identificar_layout, recarregar_modelo, extrair_texto_do_arquivo, retreinar_modelo_completo
+from identificador import extrair_texto_do_arquivo, retreinar_modelo_completo
+from cliente_inferencia import identificar_layout, recarregar_modelo, iniciar_aquecimento, estado_do_modelo
 import discord
 import shutil
 import subprocess
 import datetime
 import asyncio
 from trello import TrelloClient
+from fila_identificacao import FilaIdentificacao
+from fila_treinamento import descrever_estado_treinamento
+import metricas
 
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 TRELLO_API_KEY = os.getenv('TRELLO_API_KEY')
 TRELLO_API_TOKEN = os.getenv('TRELLO_API_TOKEN')
 TRELLO_BOARD_ID = os.getenv('TRELLO_BOARD_ID')
 
-PASTA_TEMP = 'temp_files'
 PASTA_TREINAMENTO = 'arquivos_de_treinamento'
 PASTA_CACHE = 'cache_de_texto'
-for pasta in [PASTA_TEMP, PASTA_TREINAMENTO, PASTA_CACHE]:
+for pasta in [PASTA_TREINAMENTO, PASTA_CACHE]:
     if not os.path.exists(pasta):
         os.makedirs(pasta)
 intents = discord.Intents.default()
@@ -34,9 +37,42 @@ EXTENSOES_SUPORTADAS = ['.pdf', '.xlsx', '.xls', '.txt', '.csv', '.xml']
 arquivos_recentes = {}
 treinamento_em_andamento = False
 
+# Identificações rodam em threads, fora do loop do bot: um PDF pesado não trava os outros canais.
+MAX_IDENTIFICACOES_SIMULTANEAS = int(os.getenv('MAX_IDENTIFICACOES_SIMULTANEAS', '2'))
+MAX_IDENTIFICACOES_POR_SERVIDOR = int(os.getenv('MAX_IDENTIFICACOES_POR_SERVIDOR', '1'))
+TIMEOUT_IDENTIFICACAO = int(os.getenv('TIMEOUT_IDENTIFICACAO', '300'))
+fila = FilaIdentificacao(MAX_IDENTIFICACOES_SIMULTANEAS, MAX_IDENTIFICACOES_POR_SERVIDOR, TIMEOUT_IDENTIFICACAO)
+
+def texto_analisando(nome_arquivo, aviso_sistema, posicao):
+    texto = f"Analisando `{nome_arquivo}`{aviso_sistema}..."
+    if posicao > 0:
+        texto += f" (posição na fila: {posicao})"
+    return texto
+
+async def acompanhar_fila(msg_processando, ticket, nome_arquivo, aviso_sistema):
+    posicao_exibida = 0
+    while True:
+        posicao = fila.posicao(ticket)
+        if posicao != posicao_exibida:
+            posicao_exibida = posicao
+            await msg_processando.edit(content=texto_analisando(nome_arquivo, aviso_sistema, posicao))
+        if posicao == 0: return
+        await asyncio.sleep(2)
+
+async def identificar_na_fila(message, msg_processando, nome_arquivo, aviso_sistema, *args, **kwargs):
+    chave_servidor = message.guild.id if message.guild else message.channel.id
+    ticket = fila.novo_ticket()
+    tarefa = asyncio.ensure_future(fila.executar(ticket, chave_servidor, identificar_layout, *args, **kwargs))
+    await asyncio.sleep(0) # deixa a tarefa ocupar uma vaga livre antes de mostrar a posição na fila
+    acompanhamento = asyncio.create_task(acompanhar_fila(msg_processando, ticket, nome_arquivo, aviso_sistema))
+    try:
+        return await tarefa
+    finally:
+        acompanhamento.cancel()
+
 @client.event
 async def on_ready():
-    print(f'Bot está online como {client.user}')
+    print(f"Bot está online como {client.user} (modelo: {await asyncio.to_thread(estado_do_modelo)})")
 
 @client.event
 async def on_message(message):
@@ -46,6 +82,10 @@ async def on_message(message):
     msg_lower = message.content.lower()
     
     # ... (os comandos de ajuda e trello não mudam)
+
+    if msg_lower == '!status':
+        await message.channel.send(f"Bot online. Estado do modelo: **{await asyncio.to_thread(estado_do_modelo)}**. Análises na fila: **{fila.tamanho}**.\n{descrever_estado_treinamento()}")
+        return
     
     if message.attachments:
         for attachment in message.attachments:
@@ -53,10 +93,13 @@ async def on_message(message):
                 sistema_alvo = message.content.strip()
                 aviso_sistema = f" com preferência para **{sistema_alvo}**" if sistema_alvo else ""
                 msg_processando = await message.channel.send(f"Analisando `{attachment.filename}`{aviso_sistema}...")
-                caminho_arquivo_temp = os.path.join(PASTA_TEMP, attachment.filename)
-                await attachment.save(caminho_arquivo_temp)
-                arquivos_recentes[message.channel.id] = {'caminho': caminho_arquivo_temp, 'nome': attachment.filename}
-                resultados = identificar_layout(caminho_arquivo_temp, sistema_alvo=sistema_alvo)
+                # O anexo fica só em memória; o nome original informa o formato.
+                conteudo_arquivo = await attachment.read()
+                arquivos_recentes[message.channel.id] = {'conteudo': conteudo_arquivo, 'nome': attachment.filename}
+                try:
+                    resultados = await identificar_na_fila(message, msg_processando, attachment.filename, aviso_sistema, conteudo_arquivo, sistema_alvo=sistema_alvo, extensao=attachment.filename)
+                except asyncio.TimeoutError:
+                    await msg_processando.edit(content=f"⏱️ A análise de `{attachment.filename}` excedeu o tempo limite. Tente novamente mais tarde."); continue
                 if resultados == "SENHA_NECESSARIA":
                     await msg_processando.edit(content=f"🔒 `{attachment.filename}` está protegido. Por favor, envie a senha.")
                     def check(m): return m.author == message.author and m.channel == message.channel
@@ -64,11 +107,14 @@ async def on_message(message):
                         senha_msg = await client.wait_for('message', timeout=120.0, check=check)
                         senha_manual = senha_msg.content
                         arquivos_recentes[message.channel.id]['senha_fornecida'] = senha_manual
-                        await msg_processando.edit(content=f"Senha recebida. Processando novamente...")
-                        resultados = identificar_layout(caminho_arquivo_temp, sistema_alvo=sistema_alvo, senha_manual=senha_manual)
                     except asyncio.TimeoutError:
                         await msg_processando.edit(content="Tempo esgotado."); return
-                
+                    await msg_processando.edit(content=f"Senha recebida. Processando novamente...")
+                    try:
+                        resultados = await identificar_na_fila(message, msg_processando, attachment.filename, aviso_sistema, conteudo_arquivo, sistema_alvo=sistema_alvo, senha_manual=senha_manual, extensao=attachment.filename)
+                    except asyncio.TimeoutError:
+                        await msg_processando.edit(content=f"⏱️ A análise de `{attachment.filename}` excedeu o tempo limite. Tente novamente mais tarde."); continue
+
                 await msg_processando.delete()
 
                 if not resultados or isinstance(resultados, dict):
@@ -76,7 +122,7 @@ async def on_message(message):
                 elif resultados == "SENHA_INCORRETA":
                     await message.channel.send(f"❌ A senha para `{attachment.filename}` está incorreta.")
                 else:
-                    confianca_primeiro = resultados[0]['confianca_label']
+                    confianca_primeiro = resultados[0]['compatibilidade']
                     if resultados and isinstance(resultados, list) and len(resultados) > 0 and confianca_primeiro == 'Alta':
                         titulo_resposta = f"**🏆 Análise de `{attachment.filename}` concluída!**"
                     else:
@@ -84,7 +130,7 @@ async def on_message(message):
                     await message.channel.send(titulo_resposta)
                     for i, res in enumerate(resultados):
                         rank = i + 1
-                        confianca = res['confianca_label']
+                        confianca = res['compatibilidade']
                         if confianca == 'Alta':
                             emoji = "🥇" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else f"**{rank}º**"
                         else:
@@ -96,4 +142,8 @@ async def on_message(message):
                             embed.set_thumbnail(url=res['url_previa'])
                         await message.channel.send(embed=embed)
                     await message.channel.send("\nPara me ensinar, use: `Treinar layout <código>`")
+# Carrega o modelo enquanto o bot conecta ao Discord.
+iniciar_aquecimento()
+metricas.definir_processo('bot')
+metricas.iniciar_servidor_metricas()
 client.run(DISCORD_TOKEN)
\ No newline at end of file
@@ -0,0 +1,50 @@
+# Arquivo: cache_identificacao.py
+
+import threading
+from collections import OrderedDict
+
+class CacheLRU:
+    """Cache em memória com descarte do item menos usado quando passa de max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()
+        self._tamanho_total = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[0]
+
+    def guardar(self, chave, valor, tamanho):
+        if tamanho > self.max_bytes:
+            return
+        with self._trava:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._tamanho_total -= anterior[1]
+            self._itens[chave] = (valor, tamanho)
+            self._tamanho_total += tamanho
+            while self._tamanho_total > self.max_bytes:
+                _, (_, tamanho_descartado) = self._itens.popitem(last=False)
+                self._tamanho_total -= tamanho_descartado
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self._tamanho_total = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    @property
+    def tamanho_total(self):
+        return self._tamanho_total
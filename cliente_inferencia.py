@@ -0,0 +1,73 @@
+# Arquivo: cliente_inferencia.py
+
+import os
+import base64
+import requests
+
+import identificador
+
+# Com URL_SERVIDOR_INFERENCIA definida, as chamadas vão para o servidor_inferencia (um único modelo
+# aquecido para o app e o bot). Sem ela, tudo roda no próprio processo, como antes.
+TIMEOUT_CONEXAO = 5
+TIMEOUT_IDENTIFICACAO = 300
+
+_sessao = requests.Session()
+
+def url_servidor():
+    url = os.getenv('URL_SERVIDOR_INFERENCIA', '').strip()
+    return url.rstrip('/') or None
+
+def _requisitar(metodo, rota, **kwargs):
+    try:
+        resposta = _sessao.request(metodo, url_servidor() + rota, timeout=(TIMEOUT_CONEXAO, TIMEOUT_IDENTIFICACAO), **kwargs)
+        dados = resposta.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"ERRO: Falha ao falar com o servidor de inferência: {e}")
+        return {'erro': "Servidor de inferência indisponível."}
+    if resposta.status_code != 200:
+        print(f"ERRO: Servidor de inferência respondeu {resposta.status_code}: {dados.get('erro')}")
+    return dados
+
+def iniciar_aquecimento():
+    if url_servidor() is None:
+        identificador.iniciar_aquecimento()
+
+def estado_do_modelo():
+    if url_servidor() is None:
+        return identificador.estado_do_modelo()
+    return _requisitar('GET', '/saude').get('estado', 'indisponivel')
+
+def identificar_layout(arquivo_cliente, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None, senha_manual=None, extensao=None):
+    if url_servidor() is None:
+        return identificador.identificar_layout(arquivo_cliente, sistema_alvo, descricao_adicional, tipo_relatorio_alvo, senha_manual, extensao=extensao)
+    # O servidor só usa a extensão do nome enviado.
+    extensao = identificador.extensao_do_arquivo(arquivo_cliente, extensao)
+    conteudo = identificador.conteudo_do_arquivo(arquivo_cliente)
+    parametros = {'nome': f"arquivo{extensao}", 'sistema': sistema_alvo,
+                  'descricao': descricao_adicional, 'tipo_relatorio': tipo_relatorio_alvo, 'senha': senha_manual}
+    parametros = {k: v for k, v in parametros.items() if v}
+    if isinstance(conteudo, bytes):
+        dados = _requisitar('POST', '/identificar', params=parametros, data=conteudo)
+    else:
+        with open(conteudo, 'rb') as f:
+            dados = _requisitar('POST', '/identificar', params=parametros, data=f)
+    return dados['resultado'] if 'resultado' in dados else {'erro': dados.get('erro', "Falha na identificação.")}
+
+def identificar_layouts_em_lote(caminhos_arquivos, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None):
+    if url_servidor() is None:
+        return list(identificador.identificar_layouts_em_lote(caminhos_arquivos, sistema_alvo, descricao_adicional, tipo_relatorio_alvo))
+    arquivos = []
+    for caminho in caminhos_arquivos:
+        with open(caminho, 'rb') as f:
+            arquivos.append({'nome': os.path.basename(caminho), 'conteudo': base64.b64encode(f.read()).decode('ascii')})
+    dados = _requisitar('POST', '/identificar-lote', json={
+        'arquivos': arquivos, 'sistema': sistema_alvo, 'descricao': descricao_adicional, 'tipo_relatorio': tipo_relatorio_alvo,
+    })
+    if 'resultados' not in dados:
+        return [(caminho, {'erro': dados.get('erro', "Falha na identificação.")}) for caminho in caminhos_arquivos]
+    return [(caminho, item['resultado']) for caminho, item in zip(caminhos_arquivos, dados['resultados'])]
+
+def recarregar_modelo():
+    if url_servidor() is None:
+        return identificador.recarregar_modelo()
+    return bool(_requisitar('POST', '/recarregar').get('sucesso'))
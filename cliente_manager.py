@@ -0,0 +1,212 @@
+# Arquivo: cliente_manager.py
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metricas
+
+# Cliente único da API do Manager (identificador, treinador e app): sessão com pool de conexões,
+# timeouts, token reaproveitado até expirar e cache em disco do mapa layout -> imagem de prévia.
+# MANAGER_API_URL aponta para outro endereço (ex.: o substituto local deste módulo, com --servidor-local).
+API_BASE_URL_PADRAO = "https://manager.conciliadorcontabil.com.br/api/"
+TIMEOUT_CONEXAO = 5
+TIMEOUT_LEITURA = 20
+VALIDADE_TOKEN_PADRAO = 30 * 60 # segundos, quando a API não informa expires_in
+MARGEM_EXPIRACAO_TOKEN = 60
+TTL_CACHE_IMAGENS = 6 * 60 * 60
+DIRETORIO_ATUAL = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_CACHE_IMAGENS = os.path.join(DIRETORIO_ATUAL, 'cache_api', 'layouts_imagens.json')
+
+def segredo_api():
+    # Só consulta os segredos do Streamlit quando rodando dentro da aplicação web.
+    st = sys.modules.get('streamlit')
+    try:
+        return st.secrets["api_secret"]
+    except (AttributeError, KeyError, FileNotFoundError):
+        return os.getenv('API_SECRET')
+
+def _criar_sessao():
+    sessao = requests.Session()
+    tentativas = Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=['GET'])
+    adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=tentativas)
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    return sessao
+
+class ClienteManager:
+    """Acesso à API do Manager com token reaproveitado entre chamadas (renovado ao expirar ou em 401)."""
+
+    def __init__(self, base_url=None, segredo=None, sessao=None):
+        self.base_url = (base_url or os.getenv('MANAGER_API_URL') or API_BASE_URL_PADRAO).rstrip('/') + '/'
+        self._segredo = segredo
+        self.sessao = sessao or _criar_sessao()
+        self._token = None
+        self._token_expira_em = 0.0
+        self._trava = threading.Lock()
+
+    def obter_token(self, forcar=False):
+        with self._trava:
+            if not forcar and self._token and time.monotonic() < self._token_expira_em:
+                return self._token
+            segredo = self._segredo or segredo_api()
+            if not segredo:
+                raise RuntimeError("Segredo da API não configurado.")
+            resposta = self.sessao.post(f"{self.base_url}get-token", data={'secret': segredo}, timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA))
+            resposta.raise_for_status()
+            dados = resposta.json().get("data", {})
+            if not dados.get("access_token"):
+                raise RuntimeError("'access_token' não encontrado na resposta da API.")
+            validade = float(dados.get("expires_in") or VALIDADE_TOKEN_PADRAO)
+            self._token = dados["access_token"]
+            self._token_expira_em = time.monotonic() + max(validade - MARGEM_EXPIRACAO_TOKEN, 0)
+            metricas.incrementar('tokens_api')
+            return self._token
+
+    def _get(self, rota):
+        for tentativa in range(2):
+            cabecalhos = {'Authorization': f'Bearer {self.obter_token(forcar=tentativa > 0)}'}
+            with metricas.medir('api_manager', rota=rota.split('?')[0]):
+                resposta = self.sessao.get(f"{self.base_url}{rota}", headers=cabecalhos, timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA))
+            if resposta.status_code != 401: break
+        resposta.raise_for_status()
+        return resposta.json()
+
+    def listar_layouts(self):
+        layouts = self._get("layouts?orderby=id,asc").get("data", [])
+        if not isinstance(layouts, list):
+            raise RuntimeError("A chave 'data' na resposta da API não contém uma lista.")
+        # Toda listagem completa já renova o cache de imagens usado pelo identificador.
+        salvar_mapa_imagens(mapa_de_imagens(layouts))
+        return layouts
+
+_CLIENTE = None
+_TRAVA_CLIENTE = threading.Lock()
+
+def obter_cliente():
+    global _CLIENTE
+    with _TRAVA_CLIENTE:
+        if _CLIENTE is None:
+            _CLIENTE = ClienteManager()
+        return _CLIENTE
+
+def mapa_de_imagens(layouts):
+    return {str(layout.get('codigo')): layout.get('imagem') for layout in layouts if layout.get('codigo') is not None and layout.get('imagem')}
+
+def salvar_mapa_imagens(mapa):
+    try:
+        os.makedirs(os.path.dirname(ARQUIVO_CACHE_IMAGENS), exist_ok=True)
+        caminho_temporario = f"{ARQUIVO_CACHE_IMAGENS}.{os.getpid()}.tmp"
+        with open(caminho_temporario, 'w', encoding='utf-8') as f:
+            json.dump({'atualizado_em': time.time(), 'imagens': mapa}, f)
+        os.replace(caminho_temporario, ARQUIVO_CACHE_IMAGENS)
+    except OSError as e:
+        print(f"AVISO: Não foi possível gravar o cache de imagens da API: {e}")
+
+def ler_mapa_imagens():
+    """Devolve (mapa, idade em segundos) do cache em disco, ou (None, None) se não houver cache."""
+    try:
+        with open(ARQUIVO_CACHE_IMAGENS, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        return dados['imagens'], time.time() - dados['atualizado_em']
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+_THREAD_ATUALIZACAO = None
+_AO_ATUALIZAR = []
+_TRAVA_ATUALIZACAO = threading.Lock()
+
+def _atualizar_mapa_imagens():
+    global _THREAD_ATUALIZACAO
+    mapa = None
+    try:
+        mapa = mapa_de_imagens(obter_cliente().listar_layouts())
+        print(f"Cache de imagens da API atualizado: {len(mapa)} links.")
+    except Exception as e:
+        print(f"AVISO: Falha ao atualizar as imagens da API do Manager: {e}")
+    with _TRAVA_ATUALIZACAO:
+        callbacks = list(_AO_ATUALIZAR) if mapa is not None else []
+        _AO_ATUALIZAR.clear()
+        _THREAD_ATUALIZACAO = None
+    for callback in callbacks:
+        callback(mapa)
+
+def atualizar_em_segundo_plano(ao_atualizar=None):
+    """Busca o mapa de imagens numa thread (uma por vez); ao_atualizar(mapa) é chamado quando chegar."""
+    global _THREAD_ATUALIZACAO
+    with _TRAVA_ATUALIZACAO:
+        if ao_atualizar is not None:
+            _AO_ATUALIZAR.append(ao_atualizar)
+        if _THREAD_ATUALIZACAO is None:
+            _THREAD_ATUALIZACAO = threading.Thread(target=_atualizar_mapa_imagens, name="atualizacao-imagens-api", daemon=True)
+            _THREAD_ATUALIZACAO.start()
+
+def obter_mapa_imagens(ao_atualizar=None, ttl=TTL_CACHE_IMAGENS):
+    """Mapa do cache em disco, sem esperar pela rede. Vencido ou ausente, é renovado em segundo plano."""
+    mapa, idade = ler_mapa_imagens()
+    if mapa is None or idade > ttl:
+        if segredo_api():
+            atualizar_em_segundo_plano(ao_atualizar)
+        else:
+            print("AVISO: Segredo da API não configurado. Imagens não serão atualizadas.")
+    return mapa or {}
+
+# --- SUBSTITUTO LOCAL DA API (para rodar sem rede) ---
+def _layouts_locais(arquivo_metadados):
+    with open(arquivo_metadados, 'r', encoding='utf-8') as f:
+        metadados = json.load(f)
+    return [{'codigo': meta.get('codigo_layout'), 'nome': meta.get('descricao'), 'formato': meta.get('formato'), 'imagem': meta.get('url_previa')} for meta in metadados]
+
+def servir_api_local(porta, layouts):
+    class _TratadorApiLocal(BaseHTTPRequestHandler):
+        def _responder(self, dados, status=200):
+            corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path.rstrip('/').endswith('get-token'):
+                self._responder({'data': {'access_token': 'token-local', 'expires_in': VALIDADE_TOKEN_PADRAO}})
+            else:
+                self._responder({'erro': 'rota não encontrada'}, 404)
+
+        def do_GET(self):
+            if '/layouts' in self.path:
+                self._responder({'data': layouts})
+            else:
+                self._responder({'erro': 'rota não encontrada'}, 404)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), _TratadorApiLocal)
+    print(f"API do Manager local em http://127.0.0.1:{porta}/api/ ({len(layouts)} layouts). Use MANAGER_API_URL com este endereço.")
+    servidor.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cliente da API do Manager: atualiza o cache de imagens ou sobe um substituto local da API.")
+    parser.add_argument('--atualizar', action='store_true', help="Baixa a lista de layouts e renova o cache de imagens em disco.")
+    parser.add_argument('--servidor-local', action='store_true', help="Sobe um substituto local da API, servindo os layouts de um arquivo JSON.")
+    parser.add_argument('--porta', type=int, default=8790, help="Porta do substituto local.")
+    parser.add_argument('--layouts', default=os.path.join(DIRETORIO_ATUAL, 'layouts_meta.json'), help="Arquivo de metadados usado pelo substituto local.")
+    args = parser.parse_args()
+
+    if args.servidor_local:
+        servir_api_local(args.porta, _layouts_locais(args.layouts))
+    elif args.atualizar:
+        from dotenv import load_dotenv
+        load_dotenv()
+        print(f"{len(mapa_de_imagens(obter_cliente().listar_layouts()))} links de imagem gravados em '{ARQUIVO_CACHE_IMAGENS}'.")
+    else:
+        parser.print_help()
@@ -0,0 +1,185 @@
+# Arquivo: codificador.py
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from indice_embeddings import normalizar_linhas
+
+# --- BACKENDS DE CODIFICAÇÃO ---
+# 'torch': SentenceTransformer em fp32 (padrão).
+# 'onnx':  o mesmo modelo exportado para ONNX Runtime, com quantização dinâmica int8 (gerado por --exportar).
+# O backend vale para as consultas (identificador) e para o corpus (treinador); escolha com BACKEND_CODIFICADOR.
+NOME_MODELO_SEMANTICO = 'distiluse-base-multilingual-cased-v1'
+BACKEND_PADRAO = 'torch'
+DIRETORIO_ATUAL = os.path.dirname(os.path.abspath(__file__))
+PASTA_MODELO_ONNX = os.path.join(DIRETORIO_ATUAL, 'modelo_onnx')
+ARQUIVO_CONFIG_ONNX = 'codificador.json'
+VERSAO_OPSET_ONNX = 14
+SIMILARIDADE_MINIMA_PARIDADE = 0.99
+TEXTOS_PARIDADE = [
+    "EXTRATO DE CONTA CORRENTE Banco do Brasil Agência 1234-5 Conta 67890-1 Período 01/01/2024 a 31/01/2024",
+    "Data Histórico Documento Valor Saldo 02/01 PIX RECEBIDO 123456 1.500,00 C 3.250,75 C",
+    "Relatório de contas a pagar por fornecedor Vencimento Emissão Valor original Juros Desconto Valor pago",
+    "Razão analítico Conta contábil 1.1.1.02 Bancos conta movimento Lançamento Débito Crédito",
+    "Sicoob Extrato Saldo anterior Tarifa pacote serviços TED enviada Boleto pago",
+    "Movimentação financeira Fluxo de caixa realizado Entradas Saídas Saldo final do período",
+]
+
+class CodificadorTorch:
+    backend = 'torch'
+
+    def __init__(self, nome_modelo=NOME_MODELO_SEMANTICO):
+        from sentence_transformers import SentenceTransformer
+        self.modelo = SentenceTransformer(nome_modelo, device='cpu')
+        self.identificacao = nome_modelo
+
+    def codificar(self, textos, batch_size=32, mostrar_progresso=False):
+        embeddings = self.modelo.encode(list(textos), batch_size=batch_size, show_progress_bar=mostrar_progresso, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+class CodificadorOnnx:
+    backend = 'onnx'
+
+    def __init__(self, pasta=PASTA_MODELO_ONNX):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(pasta, ARQUIVO_CONFIG_ONNX), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.identificacao = identificacao_onnx(self.config)
+        self.max_tokens = self.config['max_tokens']
+        self.tokenizador = AutoTokenizer.from_pretrained(pasta)
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sessao = ort.InferenceSession(os.path.join(pasta, self.config['arquivo']), opcoes, providers=['CPUExecutionProvider'])
+
+    def codificar(self, textos, batch_size=32, mostrar_progresso=False):
+        textos = list(textos)
+        # Textos de tamanho parecido no mesmo lote: menos padding para o modelo processar.
+        ordem = np.argsort([-len(texto) for texto in textos], kind='stable')
+        lotes = range(0, len(textos), batch_size)
+        if mostrar_progresso:
+            from tqdm import tqdm
+            lotes = tqdm(lotes, desc="Codificando (onnx)")
+        saidas = []
+        for inicio in lotes:
+            entrada = self.tokenizador([textos[i] for i in ordem[inicio:inicio + batch_size]], padding=True, truncation=True, max_length=self.max_tokens, return_tensors='np')
+            saidas.append(self.sessao.run(None, {
+                'input_ids': entrada['input_ids'].astype(np.int64),
+                'attention_mask': entrada['attention_mask'].astype(np.int64),
+            })[0])
+        if not saidas:
+            return np.zeros((0, self.config['dimensoes']), dtype=np.float32)
+        embeddings = np.empty((len(textos), saidas[0].shape[1]), dtype=np.float32)
+        embeddings[ordem] = np.vstack(saidas)
+        return normalizar_linhas(embeddings)
+
+def identificacao_onnx(config):
+    return f"{config['modelo']}:onnx-{config['quantizacao']}"
+
+def _ler_config_onnx(pasta=PASTA_MODELO_ONNX):
+    try:
+        with open(os.path.join(pasta, ARQUIVO_CONFIG_ONNX), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def backend_configurado():
+    return os.getenv('BACKEND_CODIFICADOR', BACKEND_PADRAO).strip().lower()
+
+def identificacao_codificador(backend=None):
+    # Identifica os vetores gerados sem carregar o modelo (usado no manifesto e nas chaves de cache).
+    if (backend or backend_configurado()) == 'onnx':
+        config = _ler_config_onnx()
+        if config: return identificacao_onnx(config)
+    return NOME_MODELO_SEMANTICO
+
+def carregar_codificador(backend=None):
+    backend = backend or backend_configurado()
+    if backend == 'onnx':
+        if _ler_config_onnx() is not None:
+            return CodificadorOnnx()
+        print(f"AVISO: Modelo ONNX não encontrado em '{PASTA_MODELO_ONNX}'. Rode 'python codificador.py --exportar'. Usando o backend torch.")
+    elif backend != 'torch':
+        print(f"AVISO: Backend de codificação '{backend}' desconhecido. Usando o backend torch.")
+    return CodificadorTorch()
+
+def exportar_onnx(pasta=PASTA_MODELO_ONNX, nome_modelo=NOME_MODELO_SEMANTICO, quantizar=True):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class _ModeloExportavel(torch.nn.Module):
+        # Transformer + pooling + camada densa do distiluse num único grafo; a normalização fica no numpy.
+        def __init__(self, modelo):
+            super().__init__()
+            self.modelo = modelo
+
+        def forward(self, input_ids, attention_mask):
+            return self.modelo({'input_ids': input_ids, 'attention_mask': attention_mask})['sentence_embedding']
+
+    print(f"Exportando '{nome_modelo}' para ONNX em '{pasta}'...")
+    modelo = SentenceTransformer(nome_modelo, device='cpu')
+    modelo.eval()
+    os.makedirs(pasta, exist_ok=True)
+    exemplo = modelo.tokenizer(TEXTOS_PARIDADE[:2], padding=True, return_tensors='pt')
+    caminho_fp32 = os.path.join(pasta, 'modelo_fp32.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            _ModeloExportavel(modelo), (exemplo['input_ids'], exemplo['attention_mask']), caminho_fp32,
+            input_names=['input_ids', 'attention_mask'], output_names=['sentence_embedding'],
+            dynamic_axes={'input_ids': {0: 'lote', 1: 'tokens'}, 'attention_mask': {0: 'lote', 1: 'tokens'}, 'sentence_embedding': {0: 'lote'}},
+            opset_version=VERSAO_OPSET_ONNX,
+        )
+    arquivo = 'modelo_fp32.onnx'
+    if quantizar:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        arquivo = 'modelo_int8.onnx'
+        quantize_dynamic(caminho_fp32, os.path.join(pasta, arquivo), weight_type=QuantType.QInt8)
+        os.remove(caminho_fp32)
+    modelo.tokenizer.save_pretrained(pasta)
+    config = {
+        'modelo': nome_modelo,
+        'arquivo': arquivo,
+        'quantizacao': 'int8' if quantizar else 'fp32',
+        'max_tokens': modelo.max_seq_length,
+        'dimensoes': modelo.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(pasta, ARQUIVO_CONFIG_ONNX), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+    tamanho_mb = os.path.getsize(os.path.join(pasta, arquivo)) / (1024 * 1024)
+    print(f"Modelo exportado: {arquivo} ({tamanho_mb:.1f} MB).")
+    return config
+
+def verificar_paridade(textos=TEXTOS_PARIDADE, minimo=SIMILARIDADE_MINIMA_PARIDADE, repeticoes=5):
+    # Compara os vetores do ONNX com os do torch (cosseno linha a linha) e mede a latência de cada um.
+    referencia, candidato = CodificadorTorch(), CodificadorOnnx()
+    resultados = {}
+    for codificador in (referencia, candidato):
+        codificador.codificar(textos)
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            embeddings = codificador.codificar(textos)
+        resultados[codificador.backend] = (embeddings, (time.perf_counter() - inicio) / repeticoes)
+    similaridades = np.sum(resultados['torch'][0] * resultados['onnx'][0], axis=1)
+    tempo_torch, tempo_onnx = resultados['torch'][1], resultados['onnx'][1]
+    print(f"Paridade ({candidato.identificacao}): cosseno mínimo {similaridades.min():.4f}, médio {similaridades.mean():.4f} em {len(textos)} textos.")
+    print(f"Latência por lote: torch {tempo_torch * 1000:.1f} ms, onnx {tempo_onnx * 1000:.1f} ms ({tempo_torch / max(tempo_onnx, 1e-9):.1f}x).")
+    if similaridades.min() < minimo:
+        print(f"ERRO: Cosseno mínimo abaixo de {minimo}. Não use o backend ONNX com este modelo exportado.")
+        return False
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporta o modelo semântico para ONNX Runtime e confere a paridade com o torch.")
+    parser.add_argument('--exportar', action='store_true', help="Exporta o modelo para ONNX (com quantização int8) e verifica a paridade.")
+    parser.add_argument('--sem-quantizar', action='store_true', help="Exporta em fp32, sem a quantização dinâmica int8.")
+    parser.add_argument('--verificar', action='store_true', help="Apenas verifica a paridade do modelo ONNX já exportado.")
+    args = parser.parse_args()
+
+    if args.exportar:
+        exportar_onnx(quantizar=not args.sem_quantizar)
+    if args.exportar or args.verificar:
+        raise SystemExit(0 if verificar_paridade() else 1)
+    parser.print_help()
@@ -0,0 +1,71 @@
+# Arquivo: fila_identificacao.py
+
+import time
+import asyncio
+import functools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import metricas
+
+class FilaIdentificacao:
+    """Executa identificações fora do loop do asyncio, com limite global e por servidor.
+
+    As tarefas esperam a vez em ordem de chegada. Se uma tarefa estoura o tempo,
+    quem pediu recebe asyncio.TimeoutError na hora, mas as vagas (global e do servidor)
+    só são liberadas quando a thread termina, para que nem o executor nem um servidor
+    tenham mais trabalho em andamento do que o limite configurado.
+    """
+
+    def __init__(self, max_simultaneas=2, max_por_servidor=1, timeout=300):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix="identificacao")
+        self._vagas = asyncio.Semaphore(max_simultaneas)
+        self._vagas_por_servidor = defaultdict(lambda: asyncio.Semaphore(max_por_servidor))
+        self._aguardando = []
+
+    def posicao(self, ticket):
+        try:
+            return self._aguardando.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def novo_ticket(self):
+        ticket = object()
+        self._aguardando.append(ticket)
+        return ticket
+
+    async def executar(self, ticket, chave_servidor, funcao, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        chegada = time.perf_counter()
+        vagas_servidor = self._vagas_por_servidor[chave_servidor]
+        try:
+            await vagas_servidor.acquire()
+            try:
+                await self._vagas.acquire()
+            except BaseException:
+                vagas_servidor.release()
+                raise
+            self._aguardando.remove(ticket)
+            metricas.observar('espera_fila', time.perf_counter() - chegada)
+            def liberar(_=None):
+                self._vagas.release()
+                vagas_servidor.release()
+            try:
+                futuro = loop.run_in_executor(self._executor, functools.partial(funcao, *args, **kwargs))
+            except BaseException:
+                liberar()
+                raise
+            futuro.add_done_callback(liberar)
+            try:
+                return await asyncio.wait_for(asyncio.shield(futuro), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                metricas.incrementar('identificacoes_expiradas')
+                raise
+        finally:
+            if ticket in self._aguardando:
+                self._aguardando.remove(ticket)
+
+    @property
+    def tamanho(self):
+        return len(self._aguardando)
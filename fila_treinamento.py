@@ -0,0 +1,250 @@
+# Arquivo: fila_treinamento.py
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+
+import metricas
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+    import ctypes
+
+# Um único worker de treinamento por processo, e uma trava em arquivo para que app e bot nunca rodem
+# dois treinadores ao mesmo tempo. Pedidos que chegam juntos (várias confirmações seguidas) esperam
+# uma janela curta e viram uma única execução; um pedido completo engloba os rápidos pendentes.
+# O estado fica num JSON compartilhado, lido pelo painel de administração e pelo bot.
+DIRETORIO_ATUAL = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_TREINADOR = os.path.join(DIRETORIO_ATUAL, 'treinador_em_massa.py')
+ARQUIVO_ESTADO_TREINAMENTO = os.path.join(DIRETORIO_ATUAL, 'estado_treinamento.json')
+ARQUIVO_TRAVA_TREINAMENTO = os.path.join(DIRETORIO_ATUAL, 'treinamento.lock')
+ESPERA_AGRUPAMENTO = float(os.getenv('ESPERA_AGRUPAMENTO_TREINAMENTO', '20')) # segundos sem pedidos novos
+MAX_ESPERA_AGRUPAMENTO = 120 # segundos desde o primeiro pedido pendente
+INTERVALO_TRAVA_OCUPADA = 15
+
+MODOS = {
+    'rapido': ['--retreinar-rapido'],
+    'completo': [],
+}
+PRIORIDADE_MODOS = ['rapido', 'completo']
+
+def _tentar_travar(arquivo):
+    try:
+        if fcntl:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _destravar(arquivo):
+    try:
+        if fcntl:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+        else:
+            arquivo.seek(0)
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+    arquivo.close()
+
+def _abrir_trava():
+    arquivo = open(ARQUIVO_TRAVA_TREINAMENTO, 'a+')
+    if _tentar_travar(arquivo):
+        return arquivo
+    arquivo.close()
+    return None
+
+def _processo_vivo(pid):
+    # Consulta que não toca na trava: travá-la aqui, mesmo por um instante, faria o worker achar outro treino em andamento.
+    if not pid:
+        return False
+    if fcntl:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+    processo = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+    if not processo:
+        return False
+    codigo_saida = ctypes.c_ulong()
+    ctypes.windll.kernel32.GetExitCodeProcess(processo, ctypes.byref(codigo_saida))
+    ctypes.windll.kernel32.CloseHandle(processo)
+    return codigo_saida.value == 259 # STILL_ACTIVE
+
+def _gravar_estado(estado):
+    try:
+        caminho_temporario = f"{ARQUIVO_ESTADO_TREINAMENTO}.{os.getpid()}.tmp"
+        with open(caminho_temporario, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=4)
+        os.replace(caminho_temporario, ARQUIVO_ESTADO_TREINAMENTO)
+    except OSError as e:
+        print(f"AVISO: Não foi possível gravar o estado do treinamento: {e}")
+
+def ler_estado_treinamento():
+    """Estado do último treinamento agendado por qualquer processo (app ou bot)."""
+    try:
+        with open(ARQUIVO_ESTADO_TREINAMENTO, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+    except (OSError, ValueError):
+        return {'estado': 'ocioso'}
+    if estado.get('estado') == 'executando' and not _processo_vivo(estado.get('pid')):
+        # Quem estava treinando morreu sem atualizar o estado.
+        estado['estado'] = 'interrompido'
+    return estado
+
+def descrever_estado_treinamento(estado=None):
+    estado = estado or ler_estado_treinamento()
+    situacao = estado.get('estado', 'ocioso')
+    modo = 'rápido' if estado.get('modo') == 'rapido' else 'completo'
+    pedidos = estado.get('pedidos', 1)
+    agrupados = f", {pedidos} pedidos agrupados" if pedidos > 1 else ""
+    if situacao == 'agendado':
+        return f"Treinamento {modo} agendado{agrupados}."
+    if situacao == 'executando':
+        return f"Treinamento {modo} em andamento há {time.time() - estado.get('inicio', time.time()):.0f}s{agrupados}."
+    if situacao == 'concluido':
+        documentos = estado.get('documentos')
+        processados = f", {documentos} documento(s)" if documentos is not None else ""
+        return f"Último treinamento {modo} concluído em {estado.get('duracao', 0):.0f}s{processados}."
+    if situacao == 'falhou':
+        return f"Último treinamento {modo} falhou: {estado.get('erro', 'erro desconhecido')}."
+    if situacao == 'interrompido':
+        return f"Último treinamento {modo} foi interrompido."
+    return "Nenhum treinamento agendado."
+
+class FilaTreinamento:
+    """Agenda execuções do treinador em uma thread única, agrupando pedidos próximos."""
+
+    def __init__(self, espera=ESPERA_AGRUPAMENTO, max_espera=MAX_ESPERA_AGRUPAMENTO):
+        self.espera = espera
+        self.max_espera = max_espera
+        self._condicao = threading.Condition()
+        self._pendente = None # {'modo', 'pedidos', 'primeiro', 'ultimo', e 'sucesso' ao terminar}
+        self._thread = None
+
+    def solicitar(self, modo='rapido', aguardar=False):
+        """Agenda um treinamento. Com aguardar=True, bloqueia até a execução que o atende terminar."""
+        if modo not in MODOS:
+            raise ValueError(f"Modo de treinamento desconhecido: {modo}")
+        with self._condicao:
+            agora = time.time()
+            if self._pendente is None:
+                self._pendente = {'modo': modo, 'pedidos': 0, 'primeiro': agora}
+            pendente = self._pendente
+            pendente['pedidos'] += 1
+            pendente['ultimo'] = agora
+            if PRIORIDADE_MODOS.index(modo) > PRIORIDADE_MODOS.index(pendente['modo']):
+                pendente['modo'] = modo
+            metricas.incrementar('treinamentos_solicitados', modo=modo)
+            self._publicar_agendamento()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="fila-treinamento", daemon=True)
+                self._thread.start()
+            self._condicao.notify_all()
+            if not aguardar:
+                return True
+            while 'sucesso' not in pendente:
+                self._condicao.wait()
+            return pendente['sucesso']
+
+    def _publicar_agendamento(self):
+        # Enquanto outro processo treina, o estado visível continua sendo o dele.
+        atual = ler_estado_treinamento()
+        if atual.get('estado') == 'executando' and atual.get('pid') != os.getpid():
+            return
+        pendente = self._pendente
+        _gravar_estado({
+            'estado': 'agendado', 'modo': pendente['modo'], 'pedidos': pendente['pedidos'],
+            'agendado_para': min(pendente['ultimo'] + self.espera, pendente['primeiro'] + self.max_espera),
+            'pid': os.getpid(),
+        })
+
+    def _proximo(self):
+        # Espera a janela de agrupamento fechar e retira o pedido pendente.
+        with self._condicao:
+            while True:
+                if self._pendente is None:
+                    self._condicao.wait()
+                    continue
+                prazo = min(self._pendente['ultimo'] + self.espera, self._pendente['primeiro'] + self.max_espera)
+                restante = prazo - time.time()
+                if restante <= 0:
+                    return self._pendente
+                self._condicao.wait(restante)
+
+    def _executar(self):
+        while True:
+            pendente = self._proximo()
+            trava = _abrir_trava()
+            if trava is None:
+                # Outro processo (o bot ou outra instância do app) está treinando: o pedido continua pendente.
+                time.sleep(INTERVALO_TRAVA_OCUPADA)
+                continue
+            with self._condicao:
+                self._pendente = None
+                self._condicao.notify_all()
+            try:
+                sucesso = self._rodar_treinador(pendente)
+            finally:
+                _destravar(trava)
+            with self._condicao:
+                pendente['sucesso'] = sucesso
+                if self._pendente is not None:
+                    self._publicar_agendamento()
+                self._condicao.notify_all()
+
+    def _rodar_treinador(self, pendente):
+        modo = pendente['modo']
+        estado = {'estado': 'executando', 'modo': modo, 'pedidos': pendente['pedidos'], 'inicio': time.time(), 'pid': os.getpid()}
+        _gravar_estado(estado)
+        print(f"Iniciando treinamento {modo} ({pendente['pedidos']} pedido(s) agrupado(s))...")
+        descritor, caminho_resumo = tempfile.mkstemp(prefix='resumo_treinamento_', suffix='.json')
+        os.close(descritor)
+        try:
+            with metricas.medir('treinamento', modo=modo):
+                retorno = subprocess.run([sys.executable, SCRIPT_TREINADOR, *MODOS[modo], '--resumo', caminho_resumo], cwd=DIRETORIO_ATUAL).returncode
+            try:
+                with open(caminho_resumo, 'r', encoding='utf-8') as f:
+                    estado.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+        except Exception as e:
+            retorno, estado['erro'] = None, str(e)
+        finally:
+            if os.path.exists(caminho_resumo):
+                os.remove(caminho_resumo)
+        estado['fim'] = time.time()
+        estado['duracao'] = estado['fim'] - estado['inicio']
+        sucesso = retorno == 0
+        estado['estado'] = 'concluido' if sucesso else 'falhou'
+        if not sucesso and 'erro' not in estado:
+            estado['erro'] = f"o treinador terminou com código {retorno}"
+        metricas.incrementar('treinamentos', modo=modo, resultado=estado['estado'])
+        _gravar_estado(estado)
+        print(descrever_estado_treinamento(estado))
+        return sucesso
+
+_FILA = None
+_TRAVA_FILA = threading.Lock()
+
+def obter_fila_treinamento():
+    global _FILA
+    with _TRAVA_FILA:
+        if _FILA is None:
+            _FILA = FilaTreinamento()
+        return _FILA
+
+def solicitar_treinamento(modo='rapido', aguardar=False):
+    return obter_fila_treinamento().solicitar(modo, aguardar=aguardar)
@@ -2,175 +2,628 @@
 
 import os
 import fitz
-import pandas as pd
-import joblib
 import json
-from sentence_transformers import SentenceTransformer, util
 import xml.etree.ElementTree as ET
 import pytesseract
 from PIL import Image
 import io
 import re
+import multiprocessing
+import codecs
+import hashlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from collections import defaultdict
-import torch
-import subprocess
-import sys
-import requests
-import streamlit as st
+import numpy as np
+from indice_embeddings import IndiceEmbeddings
+from cache_identificacao import CacheLRU
+from agrupador_codificacao import AgrupadorCodificacao
+from codificador import carregar_codificador, identificacao_codificador
+import artefatos
+import metricas
+from cliente_manager import obter_mapa_imagens
+from fila_treinamento import solicitar_treinamento
+
+# pandas, joblib e sentence_transformers (torch) são importados sob demanda:
+# quem só usa as funções de extração não paga o custo de carregar o modelo.
 
 # --- CONFIGURAÇÕES ---
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 MAX_PAGINAS_PDF = 3
 TIMEOUT_OCR_IMAGEM = 15
+MAX_WORKERS_OCR = 4
+TAMANHO_MINIMO_IMAGEM_OCR = 40 # px; imagens menores (ícones, linhas, marcadores) não têm texto legível
 AREA_CABECALHO_PERCENTUAL = 0.15 
+MAX_ABAS_PLANILHA = 5
+MAX_LINHAS_PLANILHA = 200
+MAX_CARACTERES_TEXTO = 256 * 1024 # limite de leitura de .txt, .csv e .xml
+TAMANHO_AMOSTRA_CODIFICACAO = 64 * 1024
 STOPWORDS = []
-NOME_MODELO_SEMANTICO = 'distiluse-base-multilingual-cased-v1'
+# O distiluse trunca a entrada em 128 tokens: o texto é cortado em trechos antes de chegar ao tokenizador.
+# Linhas de extrato ("02/01 PIX RECEBIDO 123456 1.500,00 C") custam ~3 tokens WordPiece por palavra.
+PALAVRAS_POR_TRECHO = 40
+MAX_TRECHOS_POR_DOCUMENTO = 4
+AGREGACAO_SCORES = 'max' # 'max' ou 'media' dos trechos de cada layout
+N_SONDAS_IVF = 16 # listas visitadas por consulta quando há índice aproximado; None força a busca exata
+FATOR_REPONTUACAO_IVF = 4 # na busca aproximada, os MAX_RESULTADOS * fator melhores são repontuados com a busca exata
+TAMANHO_LOTE_ENCODE = 32
+# Micro-lotes: pedidos de encode que chegam juntos (várias threads) viram uma única chamada ao modelo.
+MAX_ESPERA_LOTE_DINAMICO = 0.005
+MAX_TEXTOS_LOTE_DINAMICO = 64
+TAMANHO_LOTE_ARQUIVOS = 64 # arquivos identificados juntos por identificar_layouts_em_lote
+# PDFs são lidos página a página e a leitura para quando o 1º colocado abre esta margem sobre o 2º.
+MODO_PROGRESSIVO_PDF = True
+MARGEM_PARADA_ANTECIPADA = 10.0
 
 # --- LÓGICA DE CAMINHOS ABSOLUTOS ---
 DIRETORIO_ATUAL = os.path.dirname(os.path.abspath(__file__))
+# Índice e metadados vêm da versão publicada em modelos/ (ver artefatos.py).
+# Formato antigo (pickle), usado apenas se o índice mapeável ainda não existir.
 ARQUIVO_EMBEDDINGS = os.path.join(DIRETORIO_ATUAL, 'layout_embeddings.joblib')
 ARQUIVO_LABELS = os.path.join(DIRETORIO_ATUAL, 'layout_labels.joblib')
-ARQUIVO_METADADOS = os.path.join(DIRETORIO_ATUAL, 'layouts_meta.json')
 PASTA_CACHE = os.path.join(DIRETORIO_ATUAL, 'cache_de_texto')
+PASTA_CACHE_OCR = os.path.join(DIRETORIO_ATUAL, 'cache_ocr')
+
+MAX_RESULTADOS = 5
+
+# Motor carregado sob demanda (ou em segundo plano por iniciar_aquecimento).
+_MOTOR = None
+_CARREGAMENTO_TENTADO = False
+_TRAVA_CARREGAMENTO = threading.RLock()
+_TRAVA_AQUECIMENTO = threading.Lock()
+_THREAD_AQUECIMENTO = None
+# Quem serve confere o ponteiro de versão e troca o motor quando o treinador publica outra.
+INTERVALO_MONITORAMENTO_VERSAO = 10
+_THREAD_MONITORAMENTO = None
 
-API_BASE_URL = "https://manager.conciliadorcontabil.com.br/api/"
+# Caches por conteúdo: refazer a busca do mesmo arquivo (ou o mesmo extrato enviado por
+# outra pessoa) não reabre o PDF nem refaz o OCR; mudar só os filtros não recodifica o texto.
+CACHE_TEXTOS_MAX_BYTES = 64 * 1024 * 1024
+CACHE_EMBEDDINGS_MAX_BYTES = 16 * 1024 * 1024
+CACHE_TEXTOS = CacheLRU(CACHE_TEXTOS_MAX_BYTES)
+CACHE_EMBEDDINGS = CacheLRU(CACHE_EMBEDDINGS_MAX_BYTES)
 
-MODELO_SEMANTICO, LAYOUT_EMBEDDINGS, LAYOUT_LABELS, METADADOS_LAYOUTS = None, None, None, {}
-MODELO_CARREGADO = False
+def _mesclar_imagens(metadados_locais, mapa_imagens):
+    for codigo, meta in metadados_locais.items():
+        if codigo in mapa_imagens:
+            meta['url_previa'] = mapa_imagens[codigo]
 
 def buscar_e_mesclar_imagens_api(metadados_locais):
-    print("Buscando links de imagem na API do Manager...")
-    api_secret = None
-    try:
-        api_secret = st.secrets["api_secret"]
-    except (AttributeError, KeyError, FileNotFoundError):
-        api_secret = os.getenv('API_SECRET')
+    # Usa o mapa de imagens em cache; se estiver vencido, a API é consultada em segundo plano
+    # e os links novos entram nestes mesmos metadados quando chegarem. O carregamento não espera a rede.
+    mapa_imagens = obter_mapa_imagens(ao_atualizar=lambda mapa: _mesclar_imagens(metadados_locais, mapa))
+    _mesclar_imagens(metadados_locais, mapa_imagens)
+    print(f"{len(mapa_imagens)} links de imagem do cache da API do Manager mesclados com os metadados.")
+    return metadados_locais
 
-    if not api_secret:
-        print("AVISO: Segredo da API não configurado. Imagens não serão carregadas.")
-        return metadados_locais
-    
-    try:
-        token_url = f"{API_BASE_URL}get-token"
-        response_token = requests.post(token_url, data={'secret': api_secret})
-        response_token.raise_for_status()
-        access_token = response_token.json().get("data", {}).get("access_token")
-
-        if not access_token:
-            print("ERRO: 'access_token' não encontrado na resposta da API.")
-            return metadados_locais
-
-        headers = {'Authorization': f'Bearer {access_token}'}
-        response_layouts = requests.get(f"{API_BASE_URL}layouts?orderby=id,asc", headers=headers)
-        response_layouts.raise_for_status()
-        
-        layouts_da_api_objeto = response_layouts.json()
-        layouts_da_api_lista = layouts_da_api_objeto.get("data", [])
-
-        if not isinstance(layouts_da_api_lista, list):
-             print(f"ERRO: A chave 'data' na resposta da API não contém uma lista.")
-             return metadados_locais
-
-        mapa_imagens = {str(layout.get('codigo')): layout.get('imagem') for layout in layouts_da_api_lista if layout.get('codigo') is not None and layout.get('imagem')}
-        
-        print(f"Sucesso! {len(mapa_imagens)} links de imagem encontrados. Mesclando com metadados...")
-        for codigo, meta in metadados_locais.items():
-            if codigo in mapa_imagens:
-                meta['url_previa'] = mapa_imagens[codigo]
-        
-        return metadados_locais
+def texto_para_busca(texto_arquivo, descricao_adicional=None):
+    # A descrição vem antes do texto: se a entrada passar do limite do modelo, o corte cai no documento.
+    trechos = dividir_em_trechos(texto_arquivo, max_trechos=1)
+    return ((descricao_adicional + " ") if descricao_adicional else "") + (trechos[0] if trechos else "")
 
-    except Exception as e:
-        print(f"ERRO CRÍTICO ao buscar imagens da API: {e}")
-        return metadados_locais
+def dividir_em_trechos(texto, max_trechos=MAX_TRECHOS_POR_DOCUMENTO):
+    palavras = texto.split()[:PALAVRAS_POR_TRECHO * max_trechos]
+    return [" ".join(palavras[i:i + PALAVRAS_POR_TRECHO]) for i in range(0, len(palavras), PALAVRAS_POR_TRECHO)]
 
-def carregar_modelo_semantico():
-    global MODELO_SEMANTICO, LAYOUT_EMBEDDINGS, LAYOUT_LABELS, METADADOS_LAYOUTS, MODELO_CARREGADO
-    try:
-        print("Carregando modelo semântico na memória...")
-        MODELO_SEMANTICO = SentenceTransformer(NOME_MODELO_SEMANTICO)
-        LAYOUT_EMBEDDINGS = joblib.load(ARQUIVO_EMBEDDINGS)
-        LAYOUT_LABELS = joblib.load(ARQUIVO_LABELS)
-        with open(ARQUIVO_METADADOS, 'r', encoding='utf-8') as f:
+def vetorizar_metadados(codigos, metadados):
+    def coluna(campo):
+        return np.array([str(metadados[codigo].get(campo, '')).lower() if codigo in metadados else '' for codigo in codigos], dtype=str)
+    return {
+        'tem_meta': np.array([codigo in metadados for codigo in codigos], dtype=bool),
+        'formato': coluna('formato'),
+        'tipo_relatorio': coluna('tipo_relatorio'),
+        'sistema': coluna('sistema'),
+        'descricao': coluna('descricao'),
+    }
+
+def indexar_palavras_chave(codigos, metadados):
+    indice = defaultdict(list)
+    for i, codigo in enumerate(codigos):
+        meta = metadados.get(codigo)
+        if not meta: continue
+        texto_combinado = meta.get('cabecalho', '') + " " + meta.get('descricao', '')
+        for palavra in set(re.findall(r'\b\w{3,}\b', texto_combinado.lower())):
+            indice[palavra].append(i)
+    return {palavra: np.array(posicoes, dtype=np.int64) for palavra, posicoes in indice.items()}
+
+class MotorIdentificacao:
+    """Modelo semântico, índice de embeddings e metadados de uma mesma geração do treinamento."""
+
+    def __init__(self, modelo, indice, metadados, versao=None):
+        self.modelo = modelo
+        self.versao = versao
+        self.indice = indice
+        self.codigos = indice.codigos
+        self.metadados = metadados
+        self.metadados_vetorizados = vetorizar_metadados(self.codigos, metadados)
+        self.indice_palavras = indexar_palavras_chave(self.codigos, metadados)
+        self.agrupador = AgrupadorCodificacao(self._encode, MAX_ESPERA_LOTE_DINAMICO, MAX_TEXTOS_LOTE_DINAMICO)
+
+    @staticmethod
+    def carregar_indice(caminho_indice):
+        if os.path.exists(caminho_indice):
+            return IndiceEmbeddings.abrir(caminho_indice)
+        import joblib
+        print("AVISO: Índice mapeável não encontrado. Usando os embeddings antigos em joblib.")
+        return IndiceEmbeddings.de_matriz(joblib.load(ARQUIVO_EMBEDDINGS), joblib.load(ARQUIVO_LABELS))
+
+    @classmethod
+    def carregar(cls, modelo=None):
+        # Todos os arquivos saem da mesma versão; o encoder pode ser reaproveitado do motor anterior.
+        versao, caminhos = artefatos.caminhos_da_versao()
+        if modelo is None:
+            print("Carregando modelo semântico na memória...")
+            modelo = carregar_codificador()
+        indice = cls.carregar_indice(caminhos[artefatos.NOME_INDICE])
+        with open(caminhos[artefatos.NOME_METADADOS], 'r', encoding='utf-8') as f:
             meta_list = json.load(f)
             metadados_locais = {str(item['codigo_layout']): item for item in meta_list}
-        
-        METADADOS_LAYOUTS = buscar_e_mesclar_imagens_api(metadados_locais)
+        metadados = buscar_e_mesclar_imagens_api(metadados_locais)
+        motor = cls(modelo, indice, metadados, versao)
+        busca = f"busca aproximada em {indice.ivf.listas} listas" if indice.ivf is not None else "busca exata"
+        print(f"Modelo Semântico [{modelo.identificacao}, versão {versao or 'sem versão'}] ({indice.linhas} vetores de {len(motor.codigos)} layouts, {busca}) e {len(metadados)} metadados carregados com sucesso.")
+        return motor
+
+    def _encode(self, textos):
+        return self.modelo.codificar(textos, batch_size=TAMANHO_LOTE_ENCODE)
+
+    def codificar(self, textos):
+        chaves = [(self.modelo.identificacao, hashlib.sha1(texto.encode('utf-8')).hexdigest()) for texto in textos]
+        embeddings = [CACHE_EMBEDDINGS.obter(chave) for chave in chaves]
+        faltando = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        metricas.incrementar('cache_embeddings', len(textos) - len(faltando), resultado='acerto')
+        metricas.incrementar('cache_embeddings', len(faltando), resultado='falha')
+        if faltando:
+            with metricas.medir('codificacao'):
+                novos = self.agrupador.codificar([textos[i] for i in faltando])
+            for i, embedding in zip(faltando, novos):
+                # Cópia: uma linha do lote manteria o lote inteiro vivo e o limite do cache não veria esse custo.
+                embedding = embedding.copy()
+                CACHE_EMBEDDINGS.guardar(chaves[i], embedding, embedding.nbytes)
+                embeddings[i] = embedding
+        return np.vstack(embeddings)
+
+    def pontuar(self, embeddings):
+        return self.indice.pontuar_layouts(embeddings, AGREGACAO_SCORES, N_SONDAS_IVF).astype(np.float64) * 100
+
+    def calcular_bonus(self, sistema_alvo=None, descricao_adicional=None):
+        bonus = np.zeros(len(self.codigos), dtype=np.float64)
+        colunas = self.metadados_vetorizados
+        if descricao_adicional:
+            palavras_busca = set(re.findall(r'\b\w{3,}\b', descricao_adicional.lower()))
+            if palavras_busca:
+                ocorrencias = [self.indice_palavras[palavra] for palavra in palavras_busca if palavra in self.indice_palavras]
+                if ocorrencias:
+                    palavras_em_comum = np.bincount(np.concatenate(ocorrencias), minlength=len(self.codigos))
+                    bonus += (palavras_em_comum / len(palavras_busca)) * 20
+        if sistema_alvo:
+            termo_busca = sistema_alvo.lower()
+            contem_termo = (np.char.find(colunas['sistema'], termo_busca) >= 0) | (np.char.find(colunas['descricao'], termo_busca) >= 0)
+            bonus += 25 * (contem_termo & colunas['tem_meta'])
+        return bonus
+
+    def _repontuar_exato(self, candidatos, pontuacoes, embedding, bonus=None):
+        # Na busca aproximada, layouts fora das listas sondadas chegam com -inf, e o máximo dos demais só
+        # conta as linhas sondadas (um limite inferior). Os finalistas são repontuados com todas as linhas;
+        # se a busca não alcançou layouts suficientes dos filtros pedidos, o conjunto filtrado inteiro.
+        pontuados = candidatos[np.isfinite(pontuacoes[candidatos])]
+        if len(pontuados) < min(MAX_RESULTADOS, len(candidatos)):
+            finalistas = candidatos
+        elif len(pontuados) > MAX_RESULTADOS * FATOR_REPONTUACAO_IVF:
+            finalistas = pontuados[np.argpartition(-pontuacoes[pontuados], MAX_RESULTADOS * FATOR_REPONTUACAO_IVF - 1)[:MAX_RESULTADOS * FATOR_REPONTUACAO_IVF]]
+        else:
+            finalistas = pontuados
+        pontuacoes = pontuacoes.copy()
+        pontuacoes[finalistas] = self.indice.pontuar_grupos(embedding, finalistas, AGREGACAO_SCORES).astype(np.float64) * 100
+        if bonus is not None:
+            pontuacoes[finalistas] += bonus[finalistas]
+        return finalistas, pontuacoes
+
+    def ranquear(self, pontuacoes, extensao_arquivo, tipo_relatorio_alvo=None, embedding=None, bonus=None):
+        colunas = self.metadados_vetorizados
+        filtro = colunas['tem_meta'] & (colunas['formato'] == extensao_arquivo)
+        if tipo_relatorio_alvo and tipo_relatorio_alvo.lower() != 'todos':
+            filtro &= (colunas['tipo_relatorio'] == tipo_relatorio_alvo.lower())
+        candidatos = np.flatnonzero(filtro)
+        if embedding is not None and self.indice.usa_busca_aproximada(N_SONDAS_IVF):
+            candidatos, pontuacoes = self._repontuar_exato(candidatos, pontuacoes, embedding, bonus)
+        candidatos = candidatos[np.isfinite(pontuacoes[candidatos])]
+        if len(candidatos) > MAX_RESULTADOS:
+            candidatos = candidatos[np.argpartition(-pontuacoes[candidatos], MAX_RESULTADOS - 1)[:MAX_RESULTADOS]]
+        candidatos = candidatos[np.argsort(-pontuacoes[candidatos], kind='stable')]
 
-        MODELO_CARREGADO = True
-        print(f"Modelo Semântico e {len(METADADOS_LAYOUTS)} metadados carregados com sucesso.")
+        resultados_filtrados = []
+        for i in candidatos:
+            codigo_layout = self.codigos[i]
+            meta = self.metadados[codigo_layout]
+            pontuacao = float(pontuacoes[i])
+            resultados_filtrados.append({
+                "codigo_layout": codigo_layout,
+                "pontuacao": pontuacao,
+                "banco": meta.get('descricao', f"Layout {codigo_layout}"),
+                "url_previa": meta.get('url_previa', None),
+                "compatibilidade": get_compatibilidade_label(pontuacao),
+            })
+        return resultados_filtrados
+
+    def identificar_lote(self, textos_arquivos, extensoes_arquivos, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None):
+        # Um único encode para todos os textos e um único produto de matrizes contra o índice.
+        consultas = [texto_para_busca(texto, descricao_adicional) for texto in textos_arquivos]
+        embeddings = self.codificar(consultas)
+        with metricas.medir('pontuacao'):
+            pontuacoes = self.pontuar(embeddings)
+            bonus = self.calcular_bonus(sistema_alvo, descricao_adicional)
+            pontuacoes += bonus
+            return [self.ranquear(linha, extensao, tipo_relatorio_alvo, embedding, bonus)
+                    for linha, extensao, embedding in zip(pontuacoes, extensoes_arquivos, embeddings)]
+
+    def identificar(self, texto_arquivo, extensao_arquivo, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None):
+        return self.identificar_lote([texto_arquivo], [extensao_arquivo], sistema_alvo, descricao_adicional, tipo_relatorio_alvo)[0]
+
+def carregar_modelo_semantico(reaproveitar_codificador=False):
+    global _MOTOR, _CARREGAMENTO_TENTADO
+    with _TRAVA_CARREGAMENTO:
+        _CARREGAMENTO_TENTADO = True
+        modelo = None
+        if reaproveitar_codificador and _MOTOR is not None and _MOTOR.modelo.identificacao == identificacao_codificador():
+            modelo = _MOTOR.modelo
+        try:
+            motor = MotorIdentificacao.carregar(modelo)
+        except Exception as e:
+            print(f"AVISO: Arquivos de modelo não encontrados ou erro ao carregar: {e}.")
+            return False
+        # Uma única atribuição: quem já está identificando continua com o motor anterior até terminar.
+        _MOTOR = motor
         return True
-    except Exception as e:
-        MODELO_CARREGADO = False
-        print(f"AVISO: Arquivos de modelo não encontrados ou erro ao carregar: {e}.")
-        return False
-carregar_modelo_semantico()
+
+def obter_motor():
+    if _MOTOR is None:
+        # Se o aquecimento estiver carregando, espera por ele em vez de carregar de novo.
+        with _TRAVA_CARREGAMENTO:
+            if _MOTOR is None and not _CARREGAMENTO_TENTADO:
+                carregar_modelo_semantico()
+    return _MOTOR
+
+def _monitorar_versao(intervalo):
+    versao_tentada = None
+    while True:
+        time.sleep(intervalo)
+        versao = artefatos.versao_atual()
+        motor = _MOTOR
+        if versao is None or versao == versao_tentada or (motor is not None and motor.versao == versao):
+            continue
+        # O motor novo é montado ao lado; as identificações em andamento seguem com o anterior.
+        print(f"Nova versão do modelo publicada ({versao}). Recarregando em segundo plano...")
+        versao_tentada = versao
+        carregar_modelo_semantico(reaproveitar_codificador=True)
+
+def iniciar_monitoramento_versao(intervalo=INTERVALO_MONITORAMENTO_VERSAO):
+    global _THREAD_MONITORAMENTO
+    with _TRAVA_AQUECIMENTO:
+        if _THREAD_MONITORAMENTO is not None:
+            return
+        _THREAD_MONITORAMENTO = threading.Thread(target=_monitorar_versao, args=(intervalo,), name="monitoramento-versao", daemon=True)
+        _THREAD_MONITORAMENTO.start()
+
+def iniciar_aquecimento():
+    global _THREAD_AQUECIMENTO
+    iniciar_monitoramento_versao()
+    with _TRAVA_AQUECIMENTO:
+        if _MOTOR is not None or _THREAD_AQUECIMENTO is not None:
+            return
+        _THREAD_AQUECIMENTO = threading.Thread(target=obter_motor, name="aquecimento-modelo", daemon=True)
+        _THREAD_AQUECIMENTO.start()
+
+def estado_do_modelo():
+    if _MOTOR is not None: return "pronto"
+    if _THREAD_AQUECIMENTO is not None and _THREAD_AQUECIMENTO.is_alive(): return "carregando"
+    if _CARREGAMENTO_TENTADO: return "indisponivel"
+    return "nao_carregado"
+
+_EXECUTOR_OCR = None
+_TRAVA_EXECUTOR_OCR = threading.Lock()
+
+def _obter_executor_ocr():
+    # O tesseract roda em subprocesso, então threads bastam para paralelizar o OCR.
+    global _EXECUTOR_OCR
+    with _TRAVA_EXECUTOR_OCR:
+        if _EXECUTOR_OCR is None:
+            _EXECUTOR_OCR = ThreadPoolExecutor(max_workers=MAX_WORKERS_OCR, thread_name_prefix="ocr")
+        return _EXECUTOR_OCR
+
+def _reiniciar_executor_ocr():
+    # Um processo filho herda o objeto do pool, mas não as threads dele: começa com um pool (e uma trava) novos.
+    global _EXECUTOR_OCR, _TRAVA_EXECUTOR_OCR
+    _EXECUTOR_OCR = None
+    _TRAVA_EXECUTOR_OCR = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_executor_ocr)
+
+def _caminho_cache_ocr(hash_imagem):
+    return os.path.join(PASTA_CACHE_OCR, hash_imagem + '.txt')
+
+def _ocr_imagem(hash_imagem, image_bytes):
+    caminho_cache = _caminho_cache_ocr(hash_imagem)
+    try:
+        with open(caminho_cache, 'r', encoding='utf-8') as f:
+            texto_em_cache = f.read()
+        metricas.incrementar('cache_ocr', resultado='acerto')
+        return texto_em_cache
+    except FileNotFoundError:
+        metricas.incrementar('cache_ocr', resultado='falha')
+    try:
+        imagem = Image.open(io.BytesIO(image_bytes))
+        metricas.incrementar('imagens_ocr')
+        with metricas.medir('ocr_imagem'):
+            texto_da_imagem = pytesseract.image_to_string(imagem, lang='por', timeout=TIMEOUT_OCR_IMAGEM)
+    except (RuntimeError, Exception):
+        # Timeout ou imagem ilegível: não vai para o cache, pode dar certo numa próxima vez.
+        return ""
+    try:
+        os.makedirs(PASTA_CACHE_OCR, exist_ok=True)
+        caminho_temporario = f"{caminho_cache}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(caminho_temporario, 'w', encoding='utf-8') as f:
+            f.write(texto_da_imagem)
+        os.replace(caminho_temporario, caminho_cache)
+    except OSError:
+        pass
+    return texto_da_imagem
+
+def ocr_imagens(imagens):
+    """Recebe {hash: bytes da imagem} e devolve {hash: texto}, usando o cache em disco e o pool de OCR."""
+    if not imagens: return {}
+    with metricas.medir('ocr'):
+        return _ocr_imagens(imagens)
+
+def _ocr_imagens(imagens):
+    if len(imagens) == 1:
+        hash_imagem, image_bytes = next(iter(imagens.items()))
+        return {hash_imagem: _ocr_imagem(hash_imagem, image_bytes)}
+    executor = _obter_executor_ocr()
+    futuros = {hash_imagem: executor.submit(_ocr_imagem, hash_imagem, image_bytes) for hash_imagem, image_bytes in imagens.items()}
+    return {hash_imagem: futuro.result() for hash_imagem, futuro in futuros.items()}
+
+def _imagens_das_paginas(doc, paginas, xrefs_vistos=None, hashes_vistos=None):
+    # Cada imagem entra uma vez só: por xref (a mesma imagem repetida nas páginas) e por conteúdo.
+    xrefs_vistos = set() if xrefs_vistos is None else xrefs_vistos
+    hashes_vistos = set() if hashes_vistos is None else hashes_vistos
+    imagens = {}
+    hashes_por_pagina = []
+    for pagina in paginas:
+        hashes_da_pagina = []
+        for img_info in pagina.get_images(full=True):
+            xref, largura, altura = img_info[0], img_info[2], img_info[3]
+            if xref in xrefs_vistos: continue
+            xrefs_vistos.add(xref)
+            if largura < TAMANHO_MINIMO_IMAGEM_OCR or altura < TAMANHO_MINIMO_IMAGEM_OCR: continue
+            try:
+                image_bytes = doc.extract_image(xref)["image"]
+            except (RuntimeError, Exception): continue
+            hash_imagem = hashlib.sha1(image_bytes).hexdigest()
+            if hash_imagem not in hashes_vistos:
+                hashes_vistos.add(hash_imagem)
+                imagens[hash_imagem] = image_bytes
+                hashes_da_pagina.append(hash_imagem)
+        hashes_por_pagina.append(hashes_da_pagina)
+    return imagens, hashes_por_pagina
+
+def _ler_paginas(doc, paginas, com_cabecalho=False, xrefs_vistos=None, hashes_vistos=None):
+    # Uma só leitura do texto de cada página (TextPage), de onde saem o texto completo e o recorte do cabeçalho.
+    imagens, hashes_por_pagina = _imagens_das_paginas(doc, paginas, xrefs_vistos, hashes_vistos)
+    textos_ocr = ocr_imagens(imagens)
+    partes, cabecalhos, estatisticas = [], [], []
+    for pagina, hashes_da_pagina in zip(paginas, hashes_por_pagina):
+        pagina_texto = pagina.get_textpage()
+        texto = pagina.get_text(textpage=pagina_texto)
+        textos_imagens = [textos_ocr[h] for h in hashes_da_pagina if textos_ocr[h]]
+        partes.append(texto)
+        partes.extend(" " + texto_imagem for texto_imagem in textos_imagens)
+        if com_cabecalho:
+            area_cabecalho = fitz.Rect(0, 0, pagina.rect.width, pagina.rect.height * AREA_CABECALHO_PERCENTUAL)
+            cabecalhos.append(" ".join(palavra[4] for palavra in pagina_texto.extractWORDS() if fitz.Rect(palavra[:4]).intersects(area_cabecalho)))
+        estatisticas.append({
+            'pagina': pagina.number + 1, 'caracteres': len(texto),
+            'imagens_ocr': len(hashes_da_pagina), 'caracteres_ocr': sum(len(texto_imagem) for texto_imagem in textos_imagens),
+        })
+    return "".join(partes), " ".join(cabecalhos), estatisticas
+
+def _texto_das_paginas(doc, paginas, xrefs_vistos=None, hashes_vistos=None):
+    return _ler_paginas(doc, paginas, False, xrefs_vistos, hashes_vistos)[0]
+
+def _desbloquear_pdf(doc, senha_manual=None):
+    if not doc.is_encrypted: return None
+    if senha_manual is not None:
+        return None if doc.authenticate(senha_manual) > 0 else "SENHA_INCORRETA"
+    for senha in SENHAS_COMUNS:
+        if doc.authenticate(senha) > 0: return None
+    return "SENHA_NECESSARIA"
+
+def _celula_vazia(valor):
+    return valor is None or (isinstance(valor, float) and valor != valor) or not str(valor).strip()
+
+def _texto_das_linhas(linhas):
+    # Só as células preenchidas, separadas por espaço: sem o preenchimento de colunas do DataFrame.
+    partes = []
+    for linha in linhas:
+        celulas = [str(valor).strip() for valor in linha if not _celula_vazia(valor)]
+        if celulas: partes.append(" ".join(celulas))
+    return "\n".join(partes)
+
+def _extrair_texto_xlsx(origem):
+    import openpyxl
+    # Modo somente leitura: as linhas são lidas sob demanda, sem carregar a planilha inteira.
+    pasta_de_trabalho = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    try:
+        textos_abas = []
+        for aba in pasta_de_trabalho.worksheets[:MAX_ABAS_PLANILHA]:
+            textos_abas.append(_texto_das_linhas(aba.iter_rows(max_row=MAX_LINHAS_PLANILHA, values_only=True)))
+        return "\n".join(textos_abas) + "\n"
+    finally:
+        pasta_de_trabalho.close()
+
+def _extrair_texto_xls(origem):
+    import pandas as pd
+    textos_abas = []
+    with pd.ExcelFile(origem) as excel_file:
+        for sheet_name in excel_file.sheet_names[:MAX_ABAS_PLANILHA]:
+            df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None, nrows=MAX_LINHAS_PLANILHA)
+            textos_abas.append(_texto_das_linhas(df.itertuples(index=False, name=None)))
+    return "\n".join(textos_abas) + "\n"
+
+def _detectar_codificacao(amostra):
+    if amostra.startswith(codecs.BOM_UTF8): return 'utf-8-sig'
+    if amostra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)): return 'utf-16'
+    try:
+        # Decodificador incremental: um caractere cortado no fim da amostra não conta como erro.
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        # Exportações de bancos e sistemas contábeis que não são UTF-8 costumam vir em Windows-1252.
+        return 'cp1252'
+
+def _extrair_texto_simples(arquivo):
+    if _em_memoria(arquivo):
+        # Até 4 bytes por caractere: o corte não deixa de fora nada que a leitura do disco leria.
+        codificacao = _detectar_codificacao(arquivo[:TAMANHO_AMOSTRA_CODIFICACAO])
+        return arquivo[:MAX_CARACTERES_TEXTO * 4].decode(codificacao, errors='ignore')[:MAX_CARACTERES_TEXTO]
+    with open(arquivo, 'rb') as f:
+        codificacao = _detectar_codificacao(f.read(TAMANHO_AMOSTRA_CODIFICACAO))
+    with open(arquivo, 'r', encoding=codificacao, errors='ignore') as f:
+        return f.read(MAX_CARACTERES_TEXTO)
+
+def _extrair_texto_xml(origem):
+    # iterparse descarta cada elemento já lido: memória constante mesmo em XMLs de centenas de MB.
+    # O lugar de cada texto é reservado no 'start' e preenchido no 'end', mantendo a ordem do documento.
+    partes, abertos, total_caracteres, raiz = [], [], 0, None
+    for evento, elem in ET.iterparse(origem, events=('start', 'end')):
+        if evento == 'start':
+            if raiz is None: raiz = elem
+            abertos.append((elem, len(partes)))
+            partes.append('')
+            continue
+        _, posicao = abertos.pop()
+        texto = elem.text.strip() if elem.text else ''
+        if texto:
+            partes[posicao] = texto
+            total_caracteres += len(texto) + 1
+        elif posicao == len(partes) - 1:
+            partes.pop() # sem texto próprio nem nos descendentes: o lugar reservado não é usado
+        elem.clear()
+        if len(abertos) == 1: del raiz[:] # só os filhos: o texto da raiz é preservado
+        if total_caracteres >= MAX_CARACTERES_TEXTO:
+            # O texto de um elemento ainda aberto vem antes dos filhos e já foi lido.
+            for aberto, posicao in abertos:
+                if aberto.text and aberto.text.strip(): partes[posicao] = aberto.text.strip()
+            break
+    return " ".join(parte for parte in partes if parte) + " "
+
+# --- ARQUIVOS EM DISCO OU EM MEMÓRIA ---
+# Uploads (app, bot, servidor) chegam como bytes ou objetos com read(), como o UploadedFile do Streamlit,
+# e são lidos direto da memória. Sem caminho, o formato vem da extensão declarada (ou do .name do objeto).
+def conteudo_do_arquivo(arquivo):
+    """Caminhos voltam como estão; bytes e streams viram bytes, lidos uma única vez."""
+    if isinstance(arquivo, (str, os.PathLike)): return arquivo
+    if isinstance(arquivo, (bytes, bytearray, memoryview)): return bytes(arquivo)
+    if hasattr(arquivo, 'getvalue'): return arquivo.getvalue()
+    return arquivo.read()
+def extensao_do_arquivo(arquivo, extensao=None):
+    # A extensão declarada pode vir como 'pdf', '.pdf' ou o nome original do arquivo.
+    if extensao: return '.' + extensao.lower().rsplit('.', 1)[-1]
+    nome = arquivo if isinstance(arquivo, (str, os.PathLike)) else getattr(arquivo, 'name', '')
+    return os.path.splitext(os.fspath(nome))[1].lower()
+def _em_memoria(arquivo):
+    return isinstance(arquivo, bytes)
+def _nome_do_arquivo(arquivo):
+    return "arquivo enviado" if _em_memoria(arquivo) else os.path.basename(arquivo)
+def _origem_binaria(arquivo):
+    return io.BytesIO(arquivo) if _em_memoria(arquivo) else arquivo
+def _abrir_pdf(arquivo):
+    return fitz.open(stream=arquivo, filetype='pdf') if _em_memoria(arquivo) else fitz.open(arquivo)
+def _contar_bytes_lidos(arquivo):
+    metricas.incrementar('bytes_lidos', len(arquivo) if _em_memoria(arquivo) else os.path.getsize(arquivo))
+
 SENHAS_COMUNS = ["", "123456", "0000"]
-def extrair_texto_do_arquivo(caminho_arquivo, senha_manual=None):
+def extrair_documento(arquivo, senha_manual=None, com_cabecalho=True, extensao=None):
+    """Abre o arquivo (caminho, bytes ou stream) uma única vez e devolve {'texto', 'cabecalho', 'paginas', 'total_paginas'}.
+
+    O cabeçalho (topo de cada página) e as estatísticas por página só existem para PDFs.
+    Devolve "SENHA_NECESSARIA"/"SENHA_INCORRETA" para PDFs protegidos, ou None se a leitura falhar.
+    """
+    extensao = extensao_do_arquivo(arquivo, extensao)
+    with metricas.medir('extracao', formato=extensao.lstrip('.')):
+        return _extrair_documento(conteudo_do_arquivo(arquivo), extensao, senha_manual, com_cabecalho)
+
+def extrair_texto_do_arquivo(arquivo, senha_manual=None, extensao=None):
+    documento = extrair_documento(arquivo, senha_manual, com_cabecalho=False, extensao=extensao)
+    return documento['texto'] if isinstance(documento, dict) else documento
+
+def _extrair_documento(arquivo, extensao, senha_manual=None, com_cabecalho=True):
     texto_completo = ""
-    extensao = os.path.splitext(caminho_arquivo)[1].lower()
-    nome_arquivo = os.path.basename(caminho_arquivo)
+    nome_arquivo = _nome_do_arquivo(arquivo)
     try:
+        _contar_bytes_lidos(arquivo)
         if extensao == '.pdf':
-            with fitz.open(caminho_arquivo) as doc:
-                if doc.is_encrypted:
-                    desbloqueado = False
-                    if senha_manual is not None:
-                        if doc.authenticate(senha_manual) > 0: desbloqueado = True
-                        else: return "SENHA_INCORRETA"
-                    else:
-                        for senha in SENHAS_COMUNS:
-                            if doc.authenticate(senha) > 0: desbloqueado = True; break
-                    if not desbloqueado: return "SENHA_NECESSARIA"
-                for i, pagina in enumerate(doc):
-                    if i >= MAX_PAGINAS_PDF: break
-                    texto_completo += pagina.get_text()
-                    for img_info in pagina.get_images(full=True):
-                        try:
-                            xref = img_info[0]
-                            base_image = doc.extract_image(xref)
-                            image_bytes = base_image["image"]
-                            imagem = Image.open(io.BytesIO(image_bytes))
-                            texto_da_imagem = pytesseract.image_to_string(imagem, lang='por', timeout=TIMEOUT_OCR_IMAGEM)
-                            if texto_da_imagem: texto_completo += " " + texto_da_imagem
-                        except (RuntimeError, Exception): continue
-                return texto_completo.lower()
-        elif extensao in ['.xlsx', '.xls']:
-            excel_file = pd.ExcelFile(caminho_arquivo)
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
-                texto_completo += df.to_string(index=False) + "\n"
+            with _abrir_pdf(arquivo) as doc:
+                erro_senha = _desbloquear_pdf(doc, senha_manual)
+                if erro_senha: return erro_senha
+                paginas = [doc[i] for i in range(min(MAX_PAGINAS_PDF, doc.page_count))]
+                metricas.incrementar('paginas_lidas', len(paginas))
+                texto, cabecalho, estatisticas = _ler_paginas(doc, paginas, com_cabecalho)
+                return {'texto': texto.lower(), 'cabecalho': limpar_texto_cabecalho(cabecalho), 'paginas': estatisticas, 'total_paginas': doc.page_count}
+        elif extensao == '.xlsx':
+            texto_completo = _extrair_texto_xlsx(_origem_binaria(arquivo))
+        elif extensao == '.xls':
+            texto_completo = _extrair_texto_xls(_origem_binaria(arquivo))
         elif extensao in ['.txt', '.csv']:
-            with open(caminho_arquivo, 'r', encoding='utf-8', errors='ignore') as f:
-                texto_completo = f.read()
+            texto_completo = _extrair_texto_simples(arquivo)
         elif extensao == '.xml':
-            tree = ET.parse(caminho_arquivo)
-            root = tree.getroot()
-            for elem in root.iter():
-                if elem.text: texto_completo += elem.text.strip() + ' '
+            texto_completo = _extrair_texto_xml(_origem_binaria(arquivo))
     except Exception as e:
         print(f"AVISO: Falha ao processar '{nome_arquivo}'. Erro: {e}.")
         return None
-    return texto_completo.lower()
-def extrair_texto_do_cabecalho(caminho_arquivo, senha_manual=None):
-    texto_cabecalho_bruto = ""
-    extensao = os.path.splitext(caminho_arquivo)[1].lower()
-    if extensao != '.pdf': return ""
-    try:
-        with fitz.open(caminho_arquivo) as doc:
-            if doc.is_encrypted:
-                if not (doc.authenticate(senha_manual or "") > 0): return ""
-            for i, pagina in enumerate(doc):
-                if i >= MAX_PAGINAS_PDF: break
-                altura_pagina = pagina.rect.height
-                area_cabecalho = fitz.Rect(0, 0, pagina.rect.width, altura_pagina * AREA_CABECALHO_PERCENTUAL)
-                texto_cabecalho_bruto += pagina.get_text(clip=area_cabecalho)
-    except Exception: return ""
+    return {'texto': texto_completo.lower(), 'cabecalho': "", 'paginas': [], 'total_paginas': 0}
+def extrair_texto_do_cabecalho(arquivo, senha_manual=None, extensao=None):
+    if extensao_do_arquivo(arquivo, extensao) != '.pdf': return ""
+    documento = extrair_documento(arquivo, senha_manual, extensao=extensao)
+    return documento['cabecalho'] if isinstance(documento, dict) else ""
+def limpar_texto_cabecalho(texto_cabecalho_bruto):
     texto_limpo = texto_cabecalho_bruto.lower()
     texto_limpo = re.sub(r'[^a-zA-Z\s]', '', texto_limpo)
     texto_limpo = re.sub(r'\b[a-zA-Z]\b', '', texto_limpo)
     texto_limpo = " ".join(texto_limpo.split())
     return texto_limpo
+def hash_do_conteudo(arquivo):
+    # Mesmo hash para o conteúdo em memória e para o arquivo em disco: os caches valem para os dois.
+    return hashlib.sha256(arquivo).hexdigest() if _em_memoria(arquivo) else calcular_hash_arquivo(arquivo)
+def calcular_hash_arquivo(caminho_arquivo, tamanho_bloco=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(caminho_arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+def nome_arquivo_cache(codigo_layout, hash_conteudo):
+    # O código do layout vem primeiro: o treinador identifica o layout pelo primeiro número do nome.
+    return f"{codigo_layout}_{hash_conteudo}.txt"
+def nome_arquivo_documento_cache(codigo_layout, hash_conteudo):
+    return f"{codigo_layout}_{hash_conteudo}.json"
+def gravar_documento_no_cache(pasta_cache, codigo_layout, hash_conteudo, documento):
+    # O texto fica no .txt lido pelo treinamento; cabeçalho e estatísticas das páginas, no .json ao lado.
+    # Um .txt já existente não é regravado: a data de modificação entra na assinatura do layout.
+    caminho_texto = os.path.join(pasta_cache, nome_arquivo_cache(codigo_layout, hash_conteudo))
+    if not os.path.exists(caminho_texto):
+        with open(caminho_texto, 'w', encoding='utf-8') as f:
+            f.write(documento['texto'])
+    with open(os.path.join(pasta_cache, nome_arquivo_documento_cache(codigo_layout, hash_conteudo)), 'w', encoding='utf-8') as f:
+        json.dump({chave: documento[chave] for chave in ('cabecalho', 'paginas', 'total_paginas')}, f, ensure_ascii=False)
+def ler_documento_do_cache(pasta_cache, codigo_layout, hash_conteudo):
+    """Cabeçalho e estatísticas gravados junto com o texto do cache, ou None se o documento ainda não passou pela extração única."""
+    try:
+        with open(os.path.join(pasta_cache, nome_arquivo_documento_cache(codigo_layout, hash_conteudo)), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 def normalizar_extensao(ext):
     if ext in ['xls', 'xlsx']: return 'excel'
     if ext in ['txt', 'csv']: return 'txt'
@@ -179,69 +632,137 @@ def get_compatibilidade_label(pontuacao):
     if pontuacao >= 85: return "Alta"
     elif pontuacao >= 60: return "Média"
     else: return "Baixa"
-def identificar_layout(caminho_arquivo_cliente, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None, senha_manual=None):
-    if not MODELO_CARREGADO: return {"erro": "Modelo Semântico não foi treinado."}
-    texto_arquivo = extrair_texto_do_arquivo(caminho_arquivo_cliente, senha_manual=senha_manual)
+def chave_cache_texto(arquivo, senha_manual=None, extensao=None):
+    # A senha faz parte da chave: um PDF protegido só sai do cache para quem informou a mesma senha.
+    return (hash_do_conteudo(arquivo), extensao_do_arquivo(arquivo, extensao), senha_manual)
+def _guardar_texto_no_cache(chave, texto):
+    if texto and texto not in ["SENHA_NECESSARIA", "SENHA_INCORRETA"]:
+        CACHE_TEXTOS.guardar(chave, texto, len(texto))
+def margem_entre_primeiros(resultados):
+    if not resultados: return 0.0
+    if len(resultados) == 1: return float('inf')
+    return resultados[0]['pontuacao'] - resultados[1]['pontuacao']
+
+def _identificar_pdf_progressivo(motor, arquivo, chave_cache, senha_manual=None, margem=MARGEM_PARADA_ANTECIPADA, **filtros):
+    texto_arquivo = ""
+    resultados = []
+    texto_equivale_ao_completo = False
+    try:
+        _contar_bytes_lidos(arquivo)
+        with _abrir_pdf(arquivo) as doc:
+            erro_senha = _desbloquear_pdf(doc, senha_manual)
+            if erro_senha: return erro_senha
+            xrefs_vistos, hashes_vistos = set(), set()
+            total_paginas = min(MAX_PAGINAS_PDF, doc.page_count)
+            for i in range(total_paginas):
+                metricas.incrementar('paginas_lidas')
+                with metricas.medir('extracao_pagina', formato='pdf'):
+                    texto_arquivo += _texto_das_paginas(doc, [doc[i]], xrefs_vistos, hashes_vistos).lower()
+                # A busca usa só o primeiro trecho do texto: com ele completo, mais páginas não mudam o resultado.
+                texto_equivale_ao_completo = i == total_paginas - 1 or len(texto_arquivo.split()) >= PALAVRAS_POR_TRECHO
+                if not texto_arquivo.strip(): continue
+                resultados = motor.identificar(texto_arquivo, 'pdf', **filtros)
+                if texto_equivale_ao_completo or margem_entre_primeiros(resultados) >= margem:
+                    break
+    except Exception as e:
+        print(f"AVISO: Falha ao processar '{_nome_do_arquivo(arquivo)}'. Erro: {e}.")
+        return {"erro": "Não foi possível ler o conteúdo."}
+    if not texto_arquivo.strip(): return {"erro": "Não foi possível ler o conteúdo."}
+    if texto_equivale_ao_completo:
+        # Para a busca este texto vale o mesmo que o texto completo, então pode ir para o cache.
+        _guardar_texto_no_cache(chave_cache, texto_arquivo)
+    return resultados
+
+def _tipo_de_resultado(resultado):
+    if isinstance(resultado, str): return 'senha'
+    if isinstance(resultado, dict): return 'erro'
+    return 'ok' if resultado else 'sem_layout'
+
+def identificar_layout(arquivo_cliente, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None, senha_manual=None, progressivo=MODO_PROGRESSIVO_PDF, extensao=None):
+    """Aceita o caminho do arquivo ou o conteúdo em memória (bytes ou stream); sem caminho, informe a extensão (ou o nome original)."""
+    extensao = extensao_do_arquivo(arquivo_cliente, extensao)
+    extensao_arquivo = normalizar_extensao(extensao.lstrip('.'))
+    with metricas.medir('identificacao', formato=extensao_arquivo):
+        resultado = _identificar_layout(conteudo_do_arquivo(arquivo_cliente), extensao, extensao_arquivo, sistema_alvo, descricao_adicional, tipo_relatorio_alvo, senha_manual, progressivo)
+    metricas.incrementar('identificacoes', resultado=_tipo_de_resultado(resultado))
+    return resultado
+
+def _identificar_layout(arquivo_cliente, extensao, extensao_arquivo, sistema_alvo, descricao_adicional, tipo_relatorio_alvo, senha_manual, progressivo):
+    motor = obter_motor()
+    if motor is None: return {"erro": "Modelo Semântico não foi treinado."}
+    filtros = {"sistema_alvo": sistema_alvo, "descricao_adicional": descricao_adicional, "tipo_relatorio_alvo": tipo_relatorio_alvo}
+    try:
+        chave_cache = chave_cache_texto(arquivo_cliente, senha_manual, extensao)
+    except OSError as e:
+        print(f"AVISO: Falha ao processar '{_nome_do_arquivo(arquivo_cliente)}'. Erro: {e}.")
+        return {"erro": "Não foi possível ler o conteúdo."}
+    texto_arquivo = CACHE_TEXTOS.obter(chave_cache)
+    metricas.incrementar('cache_textos', resultado='falha' if texto_arquivo is None else 'acerto')
+    if texto_arquivo is None:
+        if progressivo and extensao_arquivo == 'pdf':
+            return _identificar_pdf_progressivo(motor, arquivo_cliente, chave_cache, senha_manual=senha_manual, **filtros)
+        texto_arquivo = extrair_texto_do_arquivo(arquivo_cliente, senha_manual=senha_manual, extensao=extensao)
+        _guardar_texto_no_cache(chave_cache, texto_arquivo)
     if texto_arquivo in ["SENHA_NECESSARIA", "SENHA_INCORRETA"]: return texto_arquivo
     if not texto_arquivo: return {"erro": "Não foi possível ler o conteúdo."}
     
-    texto_final_para_busca = texto_arquivo + " " + (descricao_adicional or "")
-    
-    embedding_arquivo_novo = MODELO_SEMANTICO.encode(texto_final_para_busca, convert_to_tensor=True)
-    similaridades = util.pytorch_cos_sim(embedding_arquivo_novo, LAYOUT_EMBEDDINGS)
-    scores_brutos = similaridades[0].cpu().tolist()
-
-    resultados_brutos = []
-    for i, score in enumerate(scores_brutos):
-        codigo_layout = LAYOUT_LABELS[i]
-        resultados_brutos.append({"codigo_layout": codigo_layout, "pontuacao": score * 100})
-    
-    if descricao_adicional:
-        palavras_busca = set(re.findall(r'\b\w{3,}\b', descricao_adicional.lower()))
-        if palavras_busca:
-            for res in resultados_brutos:
-                meta = METADADOS_LAYOUTS.get(res['codigo_layout'])
-                if meta:
-                    texto_cabecalho = meta.get('cabecalho', '')
-                    texto_descricao = meta.get('descricao', '')
-                    texto_combinado = texto_cabecalho + " " + texto_descricao
-                    palavras_layout = set(re.findall(r'\b\w{3,}\b', texto_combinado.lower()))
-                    palavras_em_comum = palavras_busca.intersection(palavras_layout)
-                    if palavras_em_comum:
-                        bonus = (len(palavras_em_comum) / len(palavras_busca)) * 20
-                        res['pontuacao'] += bonus
-    if sistema_alvo:
-        for res in resultados_brutos:
-            meta = METADADOS_LAYOUTS.get(res['codigo_layout'])
-            if meta:
-                termo_busca = sistema_alvo.lower()
-                if termo_busca in str(meta.get('sistema', '')).lower() or termo_busca in str(meta.get('descricao', '')).lower():
-                    res['pontuacao'] += 25
-    
-    resultados_ordenados = sorted(resultados_brutos, key=lambda item: item['pontuacao'], reverse=True)
-    
-    extensao_arquivo = normalizar_extensao(os.path.splitext(caminho_arquivo_cliente)[1].lower().replace('.', ''))
-    resultados_filtrados = []
-    for resultado in resultados_ordenados:
-        meta = METADADOS_LAYOUTS.get(resultado['codigo_layout'])
-        if meta:
-            match_formato = (str(meta.get('formato', '')).lower() == extensao_arquivo)
-            match_tipo_relatorio = True
-            if tipo_relatorio_alvo and tipo_relatorio_alvo.lower() != 'todos':
-                match_tipo_relatorio = (str(meta.get('tipo_relatorio', '')).lower() == tipo_relatorio_alvo.lower())
-            if match_formato and match_tipo_relatorio:
-                resultado['banco'] = meta.get('descricao', f"Layout {resultado['codigo_layout']}")
-                resultado['url_previa'] = meta.get('url_previa', None)
-                resultado['compatibilidade'] = get_compatibilidade_label(resultado['pontuacao'])
-                resultados_filtrados.append(resultado)
-    
-    return resultados_filtrados[:5]
+    return motor.identificar(texto_arquivo, extensao_arquivo, **filtros)
+def _arquivo_do_item(item):
+    # Itens do lote: um caminho ou um par (conteúdo em bytes, extensão ou nome original).
+    return item if isinstance(item, tuple) else (item, None)
+def _extensao_normalizada(item):
+    return normalizar_extensao(extensao_do_arquivo(*_arquivo_do_item(item)).lstrip('.'))
+def _iniciar_processo_de_extracao():
+    metricas.coletar_eventos()
+def _extrair_texto_do_item(item):
+    # Roda no pool: tempos e contadores da extração (e do OCR) voltam junto com o texto.
+    arquivo, extensao = _arquivo_do_item(item)
+    texto = extrair_texto_do_arquivo(arquivo, extensao=extensao)
+    return texto, metricas.drenar_eventos()
+
+def identificar_layouts_em_lote(caminhos_arquivos, sistema_alvo=None, descricao_adicional=None, tipo_relatorio_alvo=None, tamanho_lote=TAMANHO_LOTE_ARQUIVOS, max_workers=None):
+    """Gera (item, resultado) na ordem de entrada, à medida que cada lote é identificado.
+
+    Cada item é um caminho ou um par (bytes, extensão), enviado em memória aos processos de extração.
+    A extração roda em paralelo num pool de processos; cada lote de textos é codificado
+    num único encode. Os resultados têm o mesmo formato de identificar_layout.
+    """
+    caminhos_arquivos = list(caminhos_arquivos)
+    motor = obter_motor()
+    if motor is None:
+        for caminho in caminhos_arquivos:
+            yield caminho, {"erro": "Modelo Semântico não foi treinado."}
+        return
+    # spawn: quem chama (servidor, app) já tem várias threads, e um fork poderia herdar uma trava presa.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_iniciar_processo_de_extracao) as executor:
+        textos = executor.map(_extrair_texto_do_item, caminhos_arquivos)
+        for inicio in range(0, len(caminhos_arquivos), tamanho_lote):
+            lote = caminhos_arquivos[inicio:inicio + tamanho_lote]
+            resultados = [None] * len(lote)
+            legiveis = []
+            for posicao, (caminho, (texto, eventos)) in enumerate(zip(lote, textos)):
+                metricas.registrar_eventos(eventos)
+                if texto in ["SENHA_NECESSARIA", "SENHA_INCORRETA"]: resultados[posicao] = texto
+                elif not texto: resultados[posicao] = {"erro": "Não foi possível ler o conteúdo."}
+                else: legiveis.append((posicao, texto))
+            if legiveis:
+                identificados = motor.identificar_lote(
+                    [texto for _, texto in legiveis],
+                    [_extensao_normalizada(lote[posicao]) for posicao, _ in legiveis],
+                    sistema_alvo=sistema_alvo, descricao_adicional=descricao_adicional, tipo_relatorio_alvo=tipo_relatorio_alvo,
+                )
+                for (posicao, _), resultado in zip(legiveis, identificados):
+                    resultados[posicao] = resultado
+            for resultado in resultados:
+                metricas.incrementar('identificacoes', resultado=_tipo_de_resultado(resultado))
+            yield from zip(lote, resultados)
+
 def recarregar_modelo():
-    return carregar_modelo_semantico()
+    return carregar_modelo_semantico(reaproveitar_codificador=True)
 def retreinar_modelo_completo():
+    # Passa pela fila de treinamento: nunca roda em paralelo com outro treinador e se junta a pedidos pendentes.
     try:
-        subprocess.run([sys.executable, 'treinador_em_massa.py'], check=True)
-        return True
+        return solicitar_treinamento('completo', aguardar=True)
     except Exception as e:
         print(f"Erro ao executar o script de retreinamento: {e}")
         return False
\ No newline at end of file
@@ -0,0 +1,82 @@
+# Arquivo: identificador_em_lote.py
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+from identificador import identificar_layouts_em_lote
+
+EXTENSOES_SUPORTADAS = ['.pdf', '.xlsx', '.xls', '.txt', '.csv', '.xml']
+COLUNAS_CSV = ['arquivo', 'posicao', 'codigo_layout', 'banco', 'pontuacao', 'compatibilidade', 'erro']
+
+def listar_arquivos(entradas):
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for nome_arquivo in sorted(os.listdir(entrada)):
+                if os.path.splitext(nome_arquivo)[1].lower() in EXTENSOES_SUPORTADAS:
+                    caminhos.append(os.path.join(entrada, nome_arquivo))
+        elif os.path.isfile(entrada):
+            caminhos.append(entrada)
+        else:
+            print(f"AVISO: '{entrada}' não encontrado. Ignorando.", file=sys.stderr)
+    return caminhos
+
+def linhas_do_resultado(caminho, resultado):
+    arquivo = os.path.basename(caminho)
+    if isinstance(resultado, str):
+        return [{'arquivo': arquivo, 'erro': resultado}]
+    if isinstance(resultado, dict):
+        return [{'arquivo': arquivo, 'erro': resultado.get('erro', '')}]
+    if not resultado:
+        return [{'arquivo': arquivo, 'erro': 'NENHUM_LAYOUT_COMPATIVEL'}]
+    return [{
+        'arquivo': arquivo,
+        'posicao': posicao,
+        'codigo_layout': res['codigo_layout'],
+        'banco': res['banco'],
+        'pontuacao': round(res['pontuacao'], 2),
+        'compatibilidade': res['compatibilidade'],
+    } for posicao, res in enumerate(resultado, start=1)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Identifica o layout de vários arquivos de uma vez.")
+    parser.add_argument('entradas', nargs='+', help="Arquivos e/ou pastas com os arquivos a identificar.")
+    parser.add_argument('--saida', default='-', help="Arquivo de saída (padrão: saída padrão).")
+    parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv', help="Formato da saída: CSV ou JSON Lines (um arquivo por linha).")
+    parser.add_argument('--sistema', default=None, help="Sistema preferido (mesmo bônus da busca individual).")
+    parser.add_argument('--descricao', default=None, help="Descrição adicional usada na busca.")
+    parser.add_argument('--tipo-relatorio', default=None, help="Filtra por tipo de relatório (Bancário, Financeiro).")
+    parser.add_argument('--workers', type=int, default=None, help="Número de processos usados na extração (padrão: número de CPUs).")
+    args = parser.parse_args()
+
+    load_dotenv()
+    caminhos = listar_arquivos(args.entradas)
+    if not caminhos:
+        print("ERRO: Nenhum arquivo suportado encontrado.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Identificando {len(caminhos)} arquivo(s)...", file=sys.stderr)
+
+    saida = sys.stdout if args.saida == '-' else open(args.saida, 'w', encoding='utf-8', newline='')
+    try:
+        escritor = csv.DictWriter(saida, fieldnames=COLUNAS_CSV) if args.formato == 'csv' else None
+        if escritor: escritor.writeheader()
+        inicio = time.perf_counter()
+        resultados_em_lote = identificar_layouts_em_lote(
+            caminhos, sistema_alvo=args.sistema, descricao_adicional=args.descricao,
+            tipo_relatorio_alvo=args.tipo_relatorio, max_workers=args.workers,
+        )
+        for caminho, resultado in resultados_em_lote:
+            if escritor:
+                escritor.writerows(linhas_do_resultado(caminho, resultado))
+            else:
+                saida.write(json.dumps({'arquivo': os.path.basename(caminho), 'resultado': resultado}, ensure_ascii=False) + "\n")
+            saida.flush()
+        duracao = max(time.perf_counter() - inicio, 1e-9)
+        print(f"Concluído em {duracao:.1f}s ({len(caminhos) / duracao:.2f} arquivos/s).", file=sys.stderr)
+    finally:
+        if saida is not sys.stdout: saida.close()
@@ -0,0 +1,295 @@
+# Arquivo: indice_embeddings.py
+
+import os
+import json
+import struct
+import numpy as np
+
+# --- FORMATO EM DISCO ---
+# Cabeçalho de 64 bytes (little-endian), seguido da matriz de embeddings em float16 ou int8.
+# No int8 cada linha tem uma escala float32, gravada depois da matriz (alinhada em 64 bytes).
+# Os labels (um por linha) ficam num arquivo ao lado: <arquivo>.labels.json
+MAGICO = b'IDXEMB\x00\x00'
+VERSAO_FORMATO = 1
+ESTRUTURA_CABECALHO = struct.Struct('<8sHBBII')
+TAMANHO_CABECALHO = 64
+TIPOS = {'float16': (1, np.float16), 'int8': (2, np.int8)}
+TIPOS_POR_CODIGO = {codigo: (nome, dtype) for nome, (codigo, dtype) in TIPOS.items()}
+LINHAS_POR_BLOCO = 16384
+
+# --- ÍNDICE APROXIMADO (IVF) ---
+# Para catálogos grandes (vetores por documento ou por cliente), as linhas são repartidas em listas pelo
+# centróide mais próximo (k-means esférico) e a consulta só pontua as linhas das listas mais próximas.
+# Fica num arquivo ao lado do índice, <arquivo>.ivf: cabeçalho de 64 bytes, centróides em float32,
+# início de cada lista (int64) e as linhas de cada lista (int32). Abaixo de MIN_LINHAS_IVF a busca exata vence.
+MAGICO_IVF = b'IDXIVF\x00\x00'
+ESTRUTURA_CABECALHO_IVF = struct.Struct('<8sHHIII')
+MIN_LINHAS_IVF = 20000
+LINHAS_POR_LISTA_IVF = 128 # alvo médio de linhas por lista
+AMOSTRA_KMEANS = 32768
+ITERACOES_KMEANS = 10
+
+def _alinhar(posicao, alinhamento=64):
+    return (posicao + alinhamento - 1) // alinhamento * alinhamento
+
+def caminho_labels(caminho_indice):
+    return caminho_indice + '.labels.json'
+
+def caminho_ivf(caminho_indice):
+    return caminho_indice + '.ivf'
+
+def agrupar_linhas_por_layout(embeddings, labels, escalas=None):
+    labels = np.asarray([str(label) for label in labels])
+    codigos, inversos = np.unique(labels, return_inverse=True)
+    ordem = np.argsort(inversos, kind='stable')
+    if not np.array_equal(ordem, np.arange(len(ordem))):
+        embeddings, labels, inversos = np.asarray(embeddings[ordem]), labels[ordem], inversos[ordem]
+        if escalas is not None: escalas = np.asarray(escalas[ordem])
+    tamanhos = np.bincount(inversos, minlength=len(codigos))
+    inicios = (np.cumsum(tamanhos) - tamanhos).astype(np.int64) # vazio quando não há linhas
+    return embeddings, escalas, labels.tolist(), codigos.tolist(), inicios, tamanhos
+
+def normalizar_linhas(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    normas = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(normas, 1e-12)
+
+class IndiceEmbeddings:
+    """Vetores normalizados de todos os trechos de treinamento, agrupados por layout."""
+
+    def __init__(self, matriz, labels, escalas=None):
+        self.matriz, self.escalas, self.labels, self.codigos, self.inicio_grupos, self.tamanho_grupos = agrupar_linhas_por_layout(matriz, labels, escalas)
+        self.ivf = None
+        self._grupo_da_linha = None
+
+    @classmethod
+    def de_matriz(cls, embeddings, labels):
+        return cls(normalizar_linhas(embeddings), labels)
+
+    @classmethod
+    def abrir(cls, caminho_indice):
+        with open(caminho_indice, 'rb') as f:
+            magico, versao, codigo_tipo, _, linhas, dimensoes = ESTRUTURA_CABECALHO.unpack(f.read(ESTRUTURA_CABECALHO.size))
+        if magico != MAGICO:
+            raise ValueError(f"'{caminho_indice}' não é um índice de embeddings.")
+        if versao != VERSAO_FORMATO:
+            raise ValueError(f"Versão {versao} do índice não suportada (esperada {VERSAO_FORMATO}).")
+        if codigo_tipo not in TIPOS_POR_CODIGO:
+            raise ValueError(f"Tipo {codigo_tipo} do índice desconhecido.")
+        with open(caminho_labels(caminho_indice), 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        if len(labels) != linhas:
+            raise ValueError(f"O índice tem {linhas} linhas, mas {len(labels)} labels.")
+        nome_tipo, dtype = TIPOS_POR_CODIGO[codigo_tipo]
+        if linhas == 0:
+            return cls(np.zeros((0, dimensoes), dtype=dtype), labels)
+        # Mapeado em memória: os processos que abrem o mesmo arquivo compartilham as páginas do cache do SO.
+        matriz = np.memmap(caminho_indice, dtype=dtype, mode='r', offset=TAMANHO_CABECALHO, shape=(linhas, dimensoes))
+        escalas = None
+        if nome_tipo == 'int8':
+            offset_escalas = _alinhar(TAMANHO_CABECALHO + matriz.nbytes)
+            escalas = np.memmap(caminho_indice, dtype=np.float32, mode='r', offset=offset_escalas, shape=(linhas,))
+        indice = cls(matriz, labels, escalas)
+        if os.path.exists(caminho_ivf(caminho_indice)):
+            ivf = IndiceIVF.abrir(caminho_ivf(caminho_indice))
+            if ivf.linhas == indice.linhas and ivf.dimensoes == indice.dimensoes:
+                indice.ivf = ivf
+            else:
+                print(f"AVISO: O índice aproximado '{caminho_ivf(caminho_indice)}' não corresponde ao índice. Usando a busca exata.")
+        return indice
+
+    @property
+    def linhas(self):
+        return self.matriz.shape[0]
+
+    @property
+    def dimensoes(self):
+        return self.matriz.shape[1]
+
+    def salvar(self, caminho_indice, tipo='int8'):
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de índice '{tipo}' inválido. Use um de: {', '.join(TIPOS)}.")
+        codigo_tipo, dtype = TIPOS[tipo]
+        embeddings = self.matriz_float32()
+        escalas = None
+        if tipo == 'int8':
+            # Quantização simétrica por linha: o maior valor absoluto de cada linha vira 127.
+            maximos = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) if len(embeddings) else np.zeros(0, dtype=np.float32)
+            matriz = np.round(embeddings / maximos[:, None] * 127).astype(np.int8)
+            escalas = (maximos / 127).astype(np.float32)
+        else:
+            matriz = embeddings.astype(dtype)
+        caminho_temporario = caminho_indice + '.tmp'
+        with open(caminho_temporario, 'wb') as f:
+            cabecalho = ESTRUTURA_CABECALHO.pack(MAGICO, VERSAO_FORMATO, codigo_tipo, 0, len(matriz), embeddings.shape[1])
+            f.write(cabecalho.ljust(TAMANHO_CABECALHO, b'\x00'))
+            f.write(np.ascontiguousarray(matriz).tobytes())
+            if escalas is not None:
+                f.write(b'\x00' * (_alinhar(f.tell()) - f.tell()))
+                f.write(escalas.tobytes())
+        with open(caminho_labels(caminho_temporario), 'w', encoding='utf-8') as f:
+            json.dump(self.labels, f)
+        os.replace(caminho_labels(caminho_temporario), caminho_labels(caminho_indice))
+        os.replace(caminho_temporario, caminho_indice)
+
+    def matriz_float32(self, inicio=0, fim=None):
+        bloco = np.asarray(self.matriz[inicio:fim], dtype=np.float32)
+        if self.escalas is not None:
+            bloco *= np.asarray(self.escalas[inicio:fim])[:, None]
+        return bloco
+
+    def similaridades(self, vetores):
+        # Produto em blocos direto sobre o buffer mapeado, sem materializar a matriz inteira em float32.
+        vetores = np.asarray(vetores, dtype=np.float32)
+        consulta = np.atleast_2d(vetores)
+        saida = np.empty((len(consulta), self.linhas), dtype=np.float32)
+        for inicio in range(0, self.linhas, LINHAS_POR_BLOCO):
+            fim = min(inicio + LINHAS_POR_BLOCO, self.linhas)
+            bloco = np.asarray(self.matriz[inicio:fim], dtype=np.float32)
+            parcial = consulta @ bloco.T
+            if self.escalas is not None:
+                parcial *= np.asarray(self.escalas[inicio:fim])
+            saida[:, inicio:fim] = parcial
+        return saida[0] if vetores.ndim == 1 else saida
+
+    def agregar_por_layout(self, scores, agregacao='max'):
+        if agregacao == 'media':
+            return np.add.reduceat(scores, self.inicio_grupos, axis=-1) / self.tamanho_grupos
+        return np.maximum.reduceat(scores, self.inicio_grupos, axis=-1)
+
+    def similaridades_das_linhas(self, vetor, linhas):
+        parcial = np.asarray(self.matriz[linhas], dtype=np.float32) @ np.asarray(vetor, dtype=np.float32)
+        if self.escalas is not None:
+            parcial *= np.asarray(self.escalas[linhas])
+        return parcial
+
+    def _linhas_dos_grupos(self, grupos):
+        return np.concatenate([np.arange(self.inicio_grupos[g], self.inicio_grupos[g] + self.tamanho_grupos[g]) for g in grupos])
+
+    def pontuar_grupos(self, vetor, grupos, agregacao='max'):
+        """Pontuação exata, para um vetor, só dos layouts dados (posições em self.codigos)."""
+        grupos = np.asarray(grupos, dtype=np.int64)
+        if not len(grupos):
+            return np.zeros(0, dtype=np.float32)
+        scores = self.similaridades_das_linhas(vetor, self._linhas_dos_grupos(grupos))
+        # Cada layout ocupa um trecho contínuo das linhas reunidas: um reduceat por layout.
+        inicios = np.concatenate(([0], np.cumsum(self.tamanho_grupos[grupos])[:-1]))
+        if agregacao == 'media':
+            return np.add.reduceat(scores, inicios) / self.tamanho_grupos[grupos]
+        return np.maximum.reduceat(scores, inicios)
+
+    def usa_busca_aproximada(self, n_sondas):
+        return self.ivf is not None and bool(n_sondas) and n_sondas < self.ivf.listas
+
+    def pontuar_layouts(self, vetores, agregacao='max', n_sondas=None):
+        """Pontuação de cada layout para cada vetor: pelo índice aproximado se houver (e n_sondas for dado), senão exata.
+
+        Na busca aproximada, layouts sem nenhuma linha nas listas sondadas ficam com -inf (não pontuados).
+        """
+        if not self.usa_busca_aproximada(n_sondas):
+            return self.agregar_por_layout(self.similaridades(vetores), agregacao)
+        if self._grupo_da_linha is None:
+            self._grupo_da_linha = np.repeat(np.arange(len(self.codigos), dtype=np.int32), self.tamanho_grupos)
+        vetores = np.asarray(vetores, dtype=np.float32)
+        consulta = np.atleast_2d(vetores)
+        saida = np.full((len(consulta), len(self.codigos)), -np.inf, dtype=np.float32)
+        for i, vetor in enumerate(consulta):
+            linhas = self.ivf.linhas_candidatas(vetor, n_sondas)
+            grupos = np.unique(self._grupo_da_linha[linhas])
+            if agregacao == 'media':
+                # A média precisa de todas as linhas do layout: os layouts candidatos são pontuados por inteiro.
+                saida[i, grupos] = self.pontuar_grupos(vetor, grupos, agregacao)
+                continue
+            scores = self.similaridades_das_linhas(vetor, linhas)
+            # As linhas estão em ordem e cada layout ocupa um trecho contínuo: um reduceat por layout candidato.
+            inicios = np.searchsorted(self._grupo_da_linha[linhas], grupos)
+            saida[i, grupos] = np.maximum.reduceat(scores, inicios)
+        return saida[0] if vetores.ndim == 1 else saida
+
+def _mais_proximos(vetores, centroides):
+    atribuicao = np.empty(len(vetores), dtype=np.int32)
+    for inicio in range(0, len(vetores), LINHAS_POR_BLOCO):
+        atribuicao[inicio:inicio + LINHAS_POR_BLOCO] = np.argmax(vetores[inicio:inicio + LINHAS_POR_BLOCO] @ centroides.T, axis=1)
+    return atribuicao
+
+def _kmeans_esferico(amostra, n_listas, iteracoes, rng):
+    centroides = amostra[rng.choice(len(amostra), n_listas, replace=False)].copy()
+    for _ in range(iteracoes):
+        atribuicao = _mais_proximos(amostra, centroides)
+        ordenada = amostra[np.argsort(atribuicao, kind='stable')]
+        ocupadas, inicios = np.unique(np.sort(atribuicao), return_index=True)
+        fins = np.append(inicios[1:], len(ordenada))
+        somas = np.stack([ordenada[inicio:fim].sum(axis=0) for inicio, fim in zip(inicios, fins)])
+        # Listas que ficaram vazias recomeçam num ponto qualquer da amostra.
+        novos = amostra[rng.choice(len(amostra), n_listas, replace=False)].copy()
+        novos[ocupadas] = normalizar_linhas(somas)
+        centroides = novos
+    return centroides
+
+class IndiceIVF:
+    """Listas invertidas sobre as linhas de um IndiceEmbeddings (IVF-Flat: a pontuação usa as linhas do próprio índice)."""
+
+    def __init__(self, centroides, inicios, ids):
+        self.centroides = centroides
+        self.inicios = inicios
+        self.ids = ids
+
+    @property
+    def listas(self):
+        return self.centroides.shape[0]
+
+    @property
+    def linhas(self):
+        return len(self.ids)
+
+    @property
+    def dimensoes(self):
+        return self.centroides.shape[1]
+
+    @classmethod
+    def construir(cls, indice, n_listas=None, iteracoes=ITERACOES_KMEANS, semente=0):
+        rng = np.random.default_rng(semente)
+        n_listas = n_listas or max(1, int(round(indice.linhas / LINHAS_POR_LISTA_IVF)))
+        n_listas = min(n_listas, indice.linhas)
+        posicoes_amostra = np.sort(rng.choice(indice.linhas, min(indice.linhas, max(AMOSTRA_KMEANS, n_listas)), replace=False))
+        # A escala do int8 é por linha: normalizar a linha quantizada dá o mesmo vetor unitário.
+        amostra = normalizar_linhas(indice.matriz[posicoes_amostra])
+        centroides = _kmeans_esferico(amostra, n_listas, iteracoes, rng).astype(np.float32)
+        # Atribuição de todas as linhas em blocos, direto sobre o índice (mapeado ou em memória).
+        listas = np.concatenate([_mais_proximos(indice.matriz_float32(inicio, inicio + LINHAS_POR_BLOCO), centroides)
+                                 for inicio in range(0, indice.linhas, LINHAS_POR_BLOCO)]) if indice.linhas else np.zeros(0, dtype=np.int32)
+        ids = np.argsort(listas, kind='stable').astype(np.int32)
+        inicios = np.concatenate(([0], np.cumsum(np.bincount(listas, minlength=n_listas)))).astype(np.int64)
+        return cls(centroides, inicios, ids)
+
+    @classmethod
+    def abrir(cls, caminho):
+        with open(caminho, 'rb') as f:
+            magico, versao, _, listas, linhas, dimensoes = ESTRUTURA_CABECALHO_IVF.unpack(f.read(ESTRUTURA_CABECALHO_IVF.size))
+        if magico != MAGICO_IVF:
+            raise ValueError(f"'{caminho}' não é um índice aproximado.")
+        if versao != VERSAO_FORMATO:
+            raise ValueError(f"Versão {versao} do índice aproximado não suportada (esperada {VERSAO_FORMATO}).")
+        offset_inicios = _alinhar(TAMANHO_CABECALHO + listas * dimensoes * 4)
+        offset_ids = _alinhar(offset_inicios + (listas + 1) * 8)
+        centroides = np.array(np.memmap(caminho, dtype=np.float32, mode='r', offset=TAMANHO_CABECALHO, shape=(listas, dimensoes)))
+        inicios = np.array(np.memmap(caminho, dtype=np.int64, mode='r', offset=offset_inicios, shape=(listas + 1,)))
+        ids = np.memmap(caminho, dtype=np.int32, mode='r', offset=offset_ids, shape=(linhas,)) if linhas else np.zeros(0, dtype=np.int32)
+        return cls(centroides, inicios, ids)
+
+    def salvar(self, caminho):
+        caminho_temporario = caminho + '.tmp'
+        with open(caminho_temporario, 'wb') as f:
+            cabecalho = ESTRUTURA_CABECALHO_IVF.pack(MAGICO_IVF, VERSAO_FORMATO, 0, self.listas, self.linhas, self.dimensoes)
+            f.write(cabecalho.ljust(TAMANHO_CABECALHO, b'\x00'))
+            f.write(np.ascontiguousarray(self.centroides, dtype=np.float32).tobytes())
+            for secao in (np.asarray(self.inicios, dtype=np.int64), np.asarray(self.ids, dtype=np.int32)):
+                f.write(b'\x00' * (_alinhar(f.tell()) - f.tell()))
+                f.write(secao.tobytes())
+        os.replace(caminho_temporario, caminho)
+
+    def linhas_candidatas(self, vetor, n_sondas):
+        # Linhas das n_sondas listas de centróide mais próximo, em ordem (leitura sequencial no índice mapeado).
+        proximidades = self.centroides @ vetor
+        sondas = np.argpartition(-proximidades, n_sondas - 1)[:n_sondas] if n_sondas < self.listas else np.arange(self.listas)
+        return np.sort(np.concatenate([self.ids[self.inicios[lista]:self.inicios[lista + 1]] for lista in sondas]))
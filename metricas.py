@@ -0,0 +1,199 @@
+# Arquivo: metricas.py
+
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Tempos por etapa (extração, OCR, encode, pontuação...) e contadores (páginas, imagens, bytes, cache),
+# compartilhados pelo app, pelo bot, pelo servidor de inferência e pelo treinador.
+# Exportação: texto no formato do Prometheus (PORTA_METRICAS ou a rota /metricas do servidor de inferência)
+# e/ou uma linha JSON por etapa no stderr (LOG_METRICAS_JSON=1).
+PREFIXO = 'identificador'
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+AMOSTRAS_POR_ETAPA = 2048 # janela usada no p50/p95 do resumo
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((chave, str(valor)) for chave, valor in rotulos.items()))
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares: return ""
+    return "{" + ",".join(f'{chave}="{valor}"' for chave, valor in pares) + "}"
+
+def _percentil(ordenados, fracao):
+    return ordenados[min(len(ordenados) - 1, int(round(fracao * (len(ordenados) - 1))))]
+
+class RegistroMetricas:
+    """Contadores e histogramas de tempo em memória, seguros para várias threads."""
+
+    def __init__(self):
+        self.processo = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self._trava = threading.Lock()
+        self._contadores = defaultdict(float)
+        self._histogramas = {}
+        self._amostras = defaultdict(lambda: deque(maxlen=AMOSTRAS_POR_ETAPA))
+        self._eventos = None # lista quando o processo só coleta eventos para outro (ver coletar_eventos)
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        with self._trava:
+            if self._eventos is not None:
+                self._eventos.append(('incrementar', nome, valor, rotulos))
+                return
+            self._contadores[_chave(nome, rotulos)] += valor
+
+    def observar(self, etapa, segundos, **rotulos):
+        chave = _chave(etapa, rotulos)
+        with self._trava:
+            if self._eventos is not None:
+                self._eventos.append(('observar', etapa, segundos, rotulos))
+                return
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = [[0] * len(LIMITES_HISTOGRAMA), 0.0, 0]
+            posicao = bisect.bisect_left(LIMITES_HISTOGRAMA, segundos)
+            if posicao < len(LIMITES_HISTOGRAMA):
+                histograma[0][posicao] += 1
+            histograma[1] += segundos
+            histograma[2] += 1
+            self._amostras[chave].append(segundos)
+        if os.getenv('LOG_METRICAS_JSON', '').lower() in ('1', 'true', 'sim'):
+            registro = {'ts': round(time.time(), 3), 'processo': self.processo, 'etapa': etapa, 'ms': round(segundos * 1000, 3), **rotulos}
+            print(json.dumps(registro, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    @contextmanager
+    def medir(self, etapa, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio, **rotulos)
+
+    def texto_prometheus(self):
+        linhas = []
+        with self._trava:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((chave, (list(h[0]), h[1], h[2])) for chave, h in self._histogramas.items())
+        for nome in sorted({nome for (nome, _), _ in contadores}):
+            linhas.append(f"# TYPE {PREFIXO}_{nome}_total counter")
+            for (nome_contador, rotulos), valor in contadores:
+                if nome_contador == nome:
+                    linhas.append(f"{PREFIXO}_{nome}_total{_formatar_rotulos(rotulos)} {valor:g}")
+        if histogramas:
+            metrica = f"{PREFIXO}_etapa_segundos"
+            linhas.append(f"# TYPE {metrica} histogram")
+            for (etapa, rotulos), (contagens, soma, total) in histogramas:
+                rotulos = (('etapa', etapa),) + rotulos
+                acumulado = 0
+                for limite, contagem in zip(LIMITES_HISTOGRAMA, contagens):
+                    acumulado += contagem
+                    linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos, [('le', f'{limite:g}')])} {acumulado}")
+                linhas.append(f"{metrica}_bucket{_formatar_rotulos(rotulos, [('le', '+Inf')])} {total}")
+                linhas.append(f"{metrica}_sum{_formatar_rotulos(rotulos)} {soma:.6f}")
+                linhas.append(f"{metrica}_count{_formatar_rotulos(rotulos)} {total}")
+        return "\n".join(linhas) + "\n"
+
+    def resumo(self):
+        with self._trava:
+            contadores = dict(self._contadores)
+            amostras = {chave: sorted(valores) for chave, valores in self._amostras.items()}
+            totais = {chave: h[2] for chave, h in self._histogramas.items()}
+        etapas = {}
+        for (etapa, rotulos), valores in sorted(amostras.items()):
+            etapas[etapa + _formatar_rotulos(rotulos)] = {
+                'total': totais[(etapa, rotulos)],
+                'p50_ms': round(_percentil(valores, 0.5) * 1000, 3),
+                'p95_ms': round(_percentil(valores, 0.95) * 1000, 3),
+                'media_ms': round(sum(valores) / len(valores) * 1000, 3),
+            }
+        return {
+            'processo': self.processo,
+            'contadores': {nome + _formatar_rotulos(rotulos): valor for (nome, rotulos), valor in sorted(contadores.items())},
+            'etapas': etapas,
+        }
+
+    def coletar_eventos(self):
+        """Passa a guardar contadores e tempos para drenar_eventos, em vez de registrá-los aqui.
+
+        Usado nos processos de um pool: o processo principal recebe os eventos com cada resultado
+        e os registra com registrar_eventos, de modo que nada fica preso no registro do filho.
+        """
+        with self._trava:
+            if self._eventos is None:
+                self._eventos = []
+
+    def drenar_eventos(self):
+        with self._trava:
+            eventos = self._eventos or []
+            if self._eventos is not None:
+                self._eventos = []
+        return eventos
+
+    def registrar_eventos(self, eventos):
+        for tipo, nome, valor, rotulos in eventos:
+            getattr(self, tipo)(nome, valor, **rotulos)
+
+    def limpar(self):
+        with self._trava:
+            self._contadores.clear()
+            self._histogramas.clear()
+            self._amostras.clear()
+
+REGISTRO = RegistroMetricas()
+incrementar = REGISTRO.incrementar
+observar = REGISTRO.observar
+medir = REGISTRO.medir
+texto_prometheus = REGISTRO.texto_prometheus
+resumo = REGISTRO.resumo
+coletar_eventos = REGISTRO.coletar_eventos
+drenar_eventos = REGISTRO.drenar_eventos
+registrar_eventos = REGISTRO.registrar_eventos
+
+def definir_processo(nome):
+    REGISTRO.processo = nome
+
+def registrar_resumo():
+    # Uma linha JSON com o resumo do processo (usado por quem roda e termina, como o treinador).
+    print(json.dumps({'resumo_metricas': resumo()}, ensure_ascii=False), file=sys.stderr, flush=True)
+
+class _TratadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metricas.json'):
+            corpo, tipo = json.dumps(resumo(), ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        elif self.path.startswith('/metricas'):
+            corpo, tipo = texto_prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+_SERVIDOR_METRICAS = None
+_TRAVA_SERVIDOR = threading.Lock()
+
+def iniciar_servidor_metricas(porta=None, host='0.0.0.0'):
+    """Expõe /metricas (Prometheus) e /metricas.json numa thread, se PORTA_METRICAS estiver definida."""
+    global _SERVIDOR_METRICAS
+    porta = porta or os.getenv('PORTA_METRICAS')
+    if not porta: return None
+    with _TRAVA_SERVIDOR:
+        if _SERVIDOR_METRICAS is not None: return _SERVIDOR_METRICAS
+        try:
+            _SERVIDOR_METRICAS = ThreadingHTTPServer((host, int(porta)), _TratadorMetricas)
+        except (OSError, ValueError) as e:
+            print(f"AVISO: Não foi possível abrir a porta de métricas {porta}: {e}")
+            return None
+        threading.Thread(target=_SERVIDOR_METRICAS.serve_forever, name="metricas", daemon=True).start()
+        print(f"Métricas disponíveis em http://{host}:{porta}/metricas")
+        return _SERVIDOR_METRICAS
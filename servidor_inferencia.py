@@ -0,0 +1,131 @@
+# Arquivo: servidor_inferencia.py
+
+import os
+import json
+import base64
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from dotenv import load_dotenv
+
+import identificador
+import metricas
+
+# Servidor HTTP mínimo (asyncio puro) que mantém um único motor aquecido em memória.
+# O app web e o bot falam com ele pelo cliente_inferencia, em vez de cada um carregar o modelo.
+HOST_PADRAO = '127.0.0.1'
+PORTA_PADRAO = 8765
+MAX_TAMANHO_REQUISICAO = 200 * 1024 * 1024
+MAX_IDENTIFICACOES_SIMULTANEAS = 4
+MOTIVOS_HTTP = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+_executor = ThreadPoolExecutor(max_workers=MAX_IDENTIFICACOES_SIMULTANEAS, thread_name_prefix="inferencia")
+
+def _filtros(dados):
+    return {
+        'sistema_alvo': dados.get('sistema') or None,
+        'descricao_adicional': dados.get('descricao') or None,
+        'tipo_relatorio_alvo': dados.get('tipo_relatorio') or None,
+    }
+
+def identificar_bytes(nome_arquivo, conteudo, senha_manual=None, **filtros):
+    # Lido direto da memória; só a extensão do nome enviado é usada.
+    extensao = os.path.splitext(os.path.basename(nome_arquivo or ''))[1]
+    return identificador.identificar_layout(conteudo, senha_manual=senha_manual, extensao=extensao, **filtros)
+
+def identificar_lote_bytes(arquivos, **filtros):
+    # Os conteúdos seguem em memória para o pool de extração, cada um com a extensão do nome enviado.
+    itens = [(base64.b64decode(arquivo.get('conteudo', '')), os.path.splitext(os.path.basename(arquivo.get('nome') or ''))[1]) for arquivo in arquivos]
+    resultados = [resultado for _, resultado in identificador.identificar_layouts_em_lote(itens, **filtros)]
+    return [{'nome': arquivo.get('nome'), 'resultado': resultado} for arquivo, resultado in zip(arquivos, resultados)]
+
+async def _em_thread(funcao, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: funcao(*args, **kwargs))
+
+async def despachar(metodo, alvo, corpo):
+    url = urlsplit(alvo)
+    parametros = {chave: valores[0] for chave, valores in parse_qs(url.query).items()}
+    if url.path == '/saude':
+        return 200, {'estado': identificador.estado_do_modelo()}
+    if url.path == '/metricas':
+        return 200, metricas.texto_prometheus()
+    if url.path == '/metricas.json':
+        return 200, metricas.resumo()
+    if metodo != 'POST':
+        return (405, {'erro': 'Use POST.'}) if url.path in ['/identificar', '/identificar-lote', '/recarregar'] else (404, {'erro': 'Rota não encontrada.'})
+    if url.path == '/identificar':
+        if not corpo: return 400, {'erro': 'Envie o conteúdo do arquivo no corpo da requisição.'}
+        resultado = await _em_thread(identificar_bytes, parametros.get('nome', ''), corpo, senha_manual=parametros.get('senha'), **_filtros(parametros))
+        return 200, {'resultado': resultado}
+    if url.path == '/identificar-lote':
+        dados = json.loads(corpo or b'{}')
+        resultados = await _em_thread(identificar_lote_bytes, dados.get('arquivos', []), **_filtros(dados))
+        return 200, {'resultados': resultados}
+    if url.path == '/recarregar':
+        return 200, {'sucesso': await _em_thread(identificador.recarregar_modelo)}
+    return 404, {'erro': 'Rota não encontrada.'}
+
+async def _responder(writer, status, resposta):
+    # Texto puro só na rota /metricas (formato do Prometheus); o resto é JSON.
+    if isinstance(resposta, str):
+        dados, tipo = resposta.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        dados, tipo = json.dumps(resposta, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+    cabecalho = (f"HTTP/1.1 {status} {MOTIVOS_HTTP[status]}\r\n"
+                 f"Content-Type: {tipo}\r\n"
+                 f"Content-Length: {len(dados)}\r\n\r\n")
+    writer.write(cabecalho.encode('latin-1') + dados)
+    await writer.drain()
+
+async def tratar_conexao(reader, writer):
+    try:
+        while True:
+            linha_inicial = await reader.readline()
+            if not linha_inicial: break
+            metodo, alvo, _ = linha_inicial.decode('latin-1').split(' ', 2)
+            cabecalhos = {}
+            while True:
+                linha = await reader.readline()
+                if linha in (b'\r\n', b'\n', b''): break
+                nome, _, valor = linha.decode('latin-1').partition(':')
+                cabecalhos[nome.strip().lower()] = valor.strip()
+            tamanho = int(cabecalhos.get('content-length', 0))
+            if tamanho > MAX_TAMANHO_REQUISICAO:
+                await _responder(writer, 413, {'erro': 'Arquivo grande demais.'})
+                break
+            corpo = await reader.readexactly(tamanho) if tamanho else b''
+            try:
+                status, resposta = await despachar(metodo.upper(), alvo, corpo)
+            except (ValueError, KeyError) as e:
+                status, resposta = 400, {'erro': f"Requisição inválida: {e}"}
+            except Exception as e:
+                print(f"ERRO ao atender '{alvo}': {e}")
+                status, resposta = 500, {'erro': str(e)}
+            await _responder(writer, status, resposta)
+            if cabecalhos.get('connection', '').lower() == 'close': break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def servir(host=HOST_PADRAO, porta=PORTA_PADRAO):
+    # A rota /saude responde enquanto o modelo ainda carrega em segundo plano.
+    identificador.iniciar_aquecimento()
+    servidor = await asyncio.start_server(tratar_conexao, host, porta)
+    print(f"Servidor de inferência ouvindo em http://{host}:{porta}")
+    async with servidor:
+        await servidor.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor de inferência que mantém o modelo carregado para o app web e o bot.")
+    parser.add_argument('--host', default=HOST_PADRAO, help="Endereço em que o servidor escuta.")
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO, help="Porta em que o servidor escuta.")
+    args = parser.parse_args()
+    load_dotenv()
+    metricas.definir_processo('servidor_inferencia')
+    try:
+        asyncio.run(servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        print("\nServidor encerrado.")
@@ -3,58 +3,56 @@
 import os
 import re
 import json
+import shutil
+import filecmp
+import hashlib
 from collections import defaultdict
 import joblib
+import numpy as np
 import pandas as pd
 import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
-from datetime import datetime
-import requests
 from dotenv import load_dotenv
 
-from identificador import extrair_texto_do_arquivo, extrair_texto_do_cabecalho, STOPWORDS
+from indice_embeddings import IndiceEmbeddings, IndiceIVF, TIPOS as TIPOS_INDICE, MIN_LINHAS_IVF
+from codificador import carregar_codificador, identificacao_codificador
+import metricas
+import artefatos
+from cliente_manager import obter_cliente, segredo_api
+from identificador import extrair_documento, gravar_documento_no_cache, ler_documento_do_cache, calcular_hash_arquivo, nome_arquivo_cache, dividir_em_trechos, STOPWORDS, PALAVRAS_POR_TRECHO, MAX_TRECHOS_POR_DOCUMENTO
 
 # --- CONFIGURAÇÕES ---
 PASTA_PRINCIPAL_TREINAMENTO = 'arquivos_de_treinamento'
 PASTA_CACHE = 'cache_de_texto'
+# Hash de cada arquivo de treinamento na última listagem e textos do cache que aguardam substituição.
+ARQUIVO_FONTES_CACHE = os.path.join(PASTA_CACHE, 'fontes.json')
+PADRAO_NOME_CACHE = re.compile(r'^\d+_[0-9a-f]{64}$')
 NOME_ARQUIVO_MAPEAMENTO = 'mapeamento_layouts.xlsx'
-NOME_MODELO_SEMANTICO = 'distiluse-base-multilingual-cased-v1'
+TAMANHO_LOTE_ENCODE = 128
 
+TIPO_INDICE = 'int8'
+# Formato antigo, lido apenas para aproveitar um treinamento anterior no modo incremental.
 ARQUIVO_EMBEDDINGS = 'layout_embeddings.joblib'
 ARQUIVO_LABELS = 'layout_labels.joblib'
 ARQUIVO_METADADOS = 'layouts_meta.json'
 ARQUIVO_VECTORIZER = 'vectorizer.joblib' # Adicionado para consistência
+EXTENSOES_SUPORTADAS = ['.pdf', '.xlsx', '.xls', '.txt', '.csv', '.xml']
 
-API_BASE_URL = "https://manager.conciliadorcontabil.com.br/api/"
 load_dotenv() 
-API_SECRET = os.getenv('API_SECRET')
 
 if not os.path.exists(PASTA_CACHE):
     os.makedirs(PASTA_CACHE)
 
 def sincronizar_mapeamento_com_api():
     print("--- Etapa de Sincronização com a API ---")
-    if not API_SECRET:
+    if not segredo_api():
         print("ERRO: Segredo da API não encontrado no .env.")
         return False
     try:
-        token_url = f"{API_BASE_URL}get-token"
-        response_token = requests.post(token_url, data={'secret': API_SECRET})
-        response_token.raise_for_status()
-        access_token = response_token.json().get("data", {}).get("access_token")
-        if not access_token:
-            print("ERRO: Não foi possível obter o access_token da API.")
-            return False
         print("Buscando todos os layouts do Manager...")
-        headers = {'Authorization': f'Bearer {access_token}'}
-        response_layouts = requests.get(f"{API_BASE_URL}layouts?orderby=id,asc", headers=headers)
-        response_layouts.raise_for_status()
-        layouts_da_api_objeto = response_layouts.json()
-        layouts_da_api_lista = layouts_da_api_objeto.get("data", [])
-        if not isinstance(layouts_da_api_lista, list):
-             print("ERRO: A API não retornou uma lista de layouts válida.")
-             return False
+        layouts_da_api_lista = obter_cliente().listar_layouts()
         dados_para_excel = []
         for layout in layouts_da_api_lista:
             formato_original = layout.get('formato')
@@ -85,7 +83,7 @@ def extrair_e_padronizar_sistema(descricao):
     elif sistema.upper() == 'CEF': return 'CEF CAIXA ECONOMICA FEDERAL'
     else: return sistema
 
-def atualizar_metadados():
+def atualizar_metadados(publicar=True):
     print("\n--- Etapa de Metadados ---")
     if not os.path.exists(NOME_ARQUIVO_MAPEAMENTO):
         print(f"ERRO: Arquivo de mapeamento '{NOME_ARQUIVO_MAPEAMENTO}' não encontrado.")
@@ -104,9 +102,9 @@ def atualizar_metadados():
                 match = re.search(r'\d+', nome_arquivo)
                 if match:
                     codigo_layout = match.group(0)
-                    if codigo_layout in mapa_layouts:
+                    if codigo_layout in mapa_layouts and os.path.splitext(nome_arquivo)[1].lower() == '.pdf':
                         caminho_completo = os.path.join(PASTA_PRINCIPAL_TREINAMENTO, nome_arquivo)
-                        texto_cabecalho = extrair_texto_do_cabecalho(caminho_completo)
+                        texto_cabecalho = _cabecalho_do_cache(caminho_completo, codigo_layout)
                         if texto_cabecalho:
                             cabecalhos_por_layout[codigo_layout] += " " + texto_cabecalho
         print("Classificando relatórios...")
@@ -122,46 +120,367 @@ def atualizar_metadados():
         with open(ARQUIVO_METADADOS, 'w', encoding='utf-8') as f:
             json.dump(metadados_completos, f, indent=4, ensure_ascii=False)
         print(f"'{ARQUIVO_METADADOS}' foi atualizado com {len(metadados_completos)} registros.")
+        if publicar and _metadados_publicados_desatualizados():
+            publicar_artefatos()
         return mapa_layouts
     except Exception as e:
         print(f"ERRO ao ler o arquivo Excel: {e}.")
         return None
 
-def treinar_modelo_ml():
+def _cabecalho_do_cache(caminho_arquivo, codigo_layout):
+    # O cabeçalho vem da mesma extração que gerou o texto do cache; só documentos em cache
+    # de antes da extração única são abertos de novo (e passam a ter o .json).
+    hash_conteudo = calcular_hash_arquivo(caminho_arquivo)
+    documento = ler_documento_do_cache(PASTA_CACHE, codigo_layout, hash_conteudo)
+    if documento is None:
+        documento = extrair_documento(caminho_arquivo)
+        if not isinstance(documento, dict): return ""
+        if documento['texto']:
+            gravar_documento_no_cache(PASTA_CACHE, codigo_layout, hash_conteudo, documento)
+    return documento['cabecalho']
+
+def _iniciar_processo_de_extracao():
+    metricas.coletar_eventos()
+
+def _extrair_para_cache(caminho_arquivo):
+    # Executado nos processos do pool; a escrita do cache e o registro das métricas ficam no processo principal.
+    documento = extrair_documento(caminho_arquivo)
+    return documento, metricas.drenar_eventos()
+
+def _ler_fontes_do_cache():
+    try:
+        with open(ARQUIVO_FONTES_CACHE, 'r', encoding='utf-8') as f:
+            fontes = json.load(f)
+        return {'arquivos': fontes.get('arquivos', {}), 'obsoletos': fontes.get('obsoletos', {})}
+    except (OSError, ValueError):
+        return {'arquivos': {}, 'obsoletos': {}}
+
+def _gravar_fontes_do_cache(fontes):
+    caminho_temporario = ARQUIVO_FONTES_CACHE + '.tmp'
+    with open(caminho_temporario, 'w', encoding='utf-8') as f:
+        json.dump(fontes, f, indent=4)
+    os.replace(caminho_temporario, ARQUIVO_FONTES_CACHE)
+
+def _nome_base_cache(codigo_layout, hash_conteudo):
+    return os.path.splitext(nome_arquivo_cache(codigo_layout, hash_conteudo))[0]
+
+def _arquivos_de_treinamento(fontes):
+    # Caminho -> (código do layout, hash do conteúdo) de cada arquivo de treinamento suportado.
+    # O registro em fontes guarda o hash de cada arquivo (recalculado só se tamanho ou data mudaram);
+    # os que mudaram ou sumiram desde a última listagem deixam o nome antigo no cache marcado como obsoleto.
+    anteriores, atuais, arquivos = fontes['arquivos'], {}, {}
+    for nome_arquivo in os.listdir(PASTA_PRINCIPAL_TREINAMENTO):
+        if os.path.splitext(nome_arquivo)[1].lower() not in EXTENSOES_SUPORTADAS: continue
+        match = re.search(r'\d+', nome_arquivo)
+        if not match: continue
+        caminho_completo = os.path.join(PASTA_PRINCIPAL_TREINAMENTO, nome_arquivo)
+        info = os.stat(caminho_completo)
+        registro = anteriores.get(nome_arquivo)
+        if registro and (registro['codigo'], registro['tamanho'], registro['mtime_ns']) == (match.group(0), info.st_size, info.st_mtime_ns):
+            hash_conteudo = registro['hash']
+        else:
+            hash_conteudo = calcular_hash_arquivo(caminho_completo)
+        atuais[nome_arquivo] = {'codigo': match.group(0), 'hash': hash_conteudo, 'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns}
+        arquivos[caminho_completo] = (atuais[nome_arquivo]['codigo'], atuais[nome_arquivo]['hash'])
+    for nome_arquivo, registro in anteriores.items():
+        atual = atuais.get(nome_arquivo)
+        if atual is None or (atual['codigo'], atual['hash']) != (registro['codigo'], registro['hash']):
+            fontes['obsoletos'].setdefault(nome_arquivo, []).append(_nome_base_cache(registro['codigo'], registro['hash']))
+    fontes['arquivos'] = atuais
+    return arquivos
+
+def _migrar_cache_antigo(arquivos):
+    # Versões anteriores do app gravavam o texto com o nome do arquivo de treinamento (<nome>.txt):
+    # ele passa para o nome <codigo>_<hash> do mesmo arquivo, sem nova extração.
+    chaves_por_nome = {os.path.basename(caminho): chave for caminho, chave in arquivos.items()}
+    migrados = 0
+    for nome_no_cache in os.listdir(PASTA_CACHE):
+        nome_base, extensao = os.path.splitext(nome_no_cache)
+        if extensao != '.txt' or nome_base not in chaves_por_nome: continue
+        origem = os.path.join(PASTA_CACHE, nome_no_cache)
+        destino = os.path.join(PASTA_CACHE, nome_arquivo_cache(*chaves_por_nome[nome_base]))
+        try:
+            if os.path.exists(destino):
+                os.remove(origem) # o texto com o nome novo já existe
+            else:
+                os.replace(origem, destino)
+            migrados += 1
+        except OSError as e:
+            print(f"AVISO: Não foi possível migrar '{nome_no_cache}' no cache. Erro: {e}.")
+    if migrados:
+        print(f"{migrados} texto(s) do cache migrado(s) para o nome por hash.")
+    return migrados
+
+def _nomes_vivos(arquivos):
+    return {_nome_base_cache(*chave) for chave in arquivos.values()}
+
+def podar_cache_de_texto():
+    """Remove do cache os textos de arquivos de treinamento apagados ou já substituídos (retreinamento rápido, sem extração)."""
+    if not os.path.exists(PASTA_PRINCIPAL_TREINAMENTO):
+        print(f"AVISO: Pasta '{PASTA_PRINCIPAL_TREINAMENTO}' não encontrada. O cache não será podado.")
+        return 0
+    fontes = _ler_fontes_do_cache()
+    arquivos = _arquivos_de_treinamento(fontes)
+    _migrar_cache_antigo(arquivos)
+    removidos = _podar_cache(fontes, arquivos)
+    _gravar_fontes_do_cache(fontes)
+    if removidos:
+        print(f"{removidos} texto(s) obsoleto(s) removido(s) do cache.")
+    return removidos
+
+def gerar_cache_de_texto(max_workers=None):
+    print("\n--- Etapa de Cache de Texto ---")
+    if not os.path.exists(PASTA_PRINCIPAL_TREINAMENTO):
+        print(f"AVISO: Pasta '{PASTA_PRINCIPAL_TREINAMENTO}' não encontrada. Pulando etapa de cache.")
+        return 0
+    inicio_listagem = time.time()
+    fontes = _ler_fontes_do_cache()
+    arquivos = _arquivos_de_treinamento(fontes)
+    _migrar_cache_antigo(arquivos)
+    ja_em_cache = set(os.listdir(PASTA_CACHE))
+    # Cópias idênticas de um mesmo layout viram uma única extração.
+    unicos = {chave: caminho for caminho, chave in arquivos.items() if nome_arquivo_cache(*chave) not in ja_em_cache}
+    pendentes = {caminho: chave for chave, caminho in unicos.items()}
+    print(f"{len(arquivos)} arquivo(s) de treinamento, {len(pendentes)} novo(s) ou alterado(s) para extrair.")
+    gravados = _extrair_pendentes(pendentes, max_workers) if pendentes else 0
+    # A poda vem depois da extração: o texto antigo de um arquivo alterado só sai com o novo já gravado.
+    removidos = _podar_cache(fontes, arquivos, inicio_listagem)
+    _gravar_fontes_do_cache(fontes)
+    print(f"{removidos} texto(s) obsoleto(s) removido(s) do cache.")
+    return gravados
+
+def _extrair_pendentes(pendentes, max_workers=None):
+    bytes_processados = sum(os.path.getsize(caminho) for caminho in pendentes)
+    gravados, falhas = 0, 0
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_iniciar_processo_de_extracao) as executor:
+        futuros = {executor.submit(_extrair_para_cache, caminho): caminho for caminho in pendentes}
+        for futuro in tqdm(as_completed(futuros), total=len(futuros), desc="Extraindo textos"):
+            caminho = futuros[futuro]
+            try:
+                documento, eventos = futuro.result()
+                metricas.registrar_eventos(eventos)
+            except Exception as e:
+                print(f"AVISO: Falha ao extrair '{os.path.basename(caminho)}'. Erro: {e}.")
+                documento = None
+            if not isinstance(documento, dict) or not documento['texto']:
+                falhas += 1
+                continue
+            gravar_documento_no_cache(PASTA_CACHE, *pendentes[caminho], documento)
+            gravados += 1
+    duracao = max(time.perf_counter() - inicio, 1e-9)
+    metricas.observar('cache_de_texto', duracao)
+    metricas.incrementar('arquivos_extraidos', gravados, resultado='ok')
+    metricas.incrementar('arquivos_extraidos', falhas, resultado='falha')
+    metricas.incrementar('bytes_lidos', bytes_processados)
+    print(f"Cache atualizado: {gravados} gravado(s), {falhas} falha(s) em {duracao:.1f}s "
+          f"({len(pendentes) / duracao:.2f} arquivos/s, {bytes_processados / duracao / 1024 / 1024:.2f} MB/s).")
+    return gravados
+
+def _remover_do_cache(nome_base):
+    removido = 0
+    for extensao in ('.txt', '.json'):
+        try:
+            os.remove(os.path.join(PASTA_CACHE, nome_base + extensao))
+            removido += extensao == '.txt'
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"AVISO: Não foi possível remover '{nome_base}{extensao}' do cache. Erro: {e}.")
+    return removido
+
+def _podar_cache(fontes, arquivos, inicio_listagem=None):
+    # Só textos com nome <codigo>_<hash>, e só quando a origem foi apagada ou o texto que a substitui já
+    # está no cache. Com inicio_listagem (etapa completa, depois da extração), também os <codigo>_<hash>
+    # sem nenhum arquivo de origem que não estejam registrados, exceto os gravados depois da listagem
+    # (uma confirmação em andamento no app).
+    vivos = _nomes_vivos(arquivos)
+    chaves_por_nome = {os.path.basename(caminho): chave for caminho, chave in arquivos.items()}
+    removidos = 0
+    for nome_arquivo, antigos in list(fontes['obsoletos'].items()):
+        chave = chaves_por_nome.get(nome_arquivo)
+        if chave is not None and not os.path.exists(os.path.join(PASTA_CACHE, nome_arquivo_cache(*chave))):
+            continue # alterado, mas o texto novo ainda não foi extraído
+        for nome_base in antigos:
+            if nome_base not in vivos: removidos += _remover_do_cache(nome_base)
+        del fontes['obsoletos'][nome_arquivo]
+    if inicio_listagem is not None:
+        aguardando = {nome_base for antigos in fontes['obsoletos'].values() for nome_base in antigos}
+        for nome_no_cache in os.listdir(PASTA_CACHE):
+            nome_base, extensao = os.path.splitext(nome_no_cache)
+            if extensao != '.txt' or not PADRAO_NOME_CACHE.match(nome_base) or nome_base in vivos or nome_base in aguardando: continue
+            try:
+                if os.path.getmtime(os.path.join(PASTA_CACHE, nome_no_cache)) >= inicio_listagem: continue
+            except OSError:
+                continue
+            removidos += _remover_do_cache(nome_base)
+    return removidos
+
+def _listar_cache_por_layout():
+    arquivos_por_layout = defaultdict(list)
+    for nome_arquivo_cache in os.listdir(PASTA_CACHE):
+        nome_original, extensao = os.path.splitext(nome_arquivo_cache)
+        if extensao != '.txt': continue # o .json ao lado guarda só o cabeçalho e as estatísticas
+        match = re.search(r'\d+', nome_original)
+        if match:
+            arquivos_por_layout[match.group(0)].append(nome_arquivo_cache)
+    return arquivos_por_layout
+
+def _assinatura_layout(nomes_arquivos):
+    # Nome, tamanho e data de modificação de cada documento: muda sempre que uma fonte do layout muda.
+    sha = hashlib.sha1()
+    for nome in sorted(nomes_arquivos):
+        info = os.stat(os.path.join(PASTA_CACHE, nome))
+        sha.update(f"{nome}:{info.st_size}:{info.st_mtime_ns}\n".encode('utf-8'))
+    return sha.hexdigest()
+
+def _carregar_modelo_anterior():
+    _, caminhos = artefatos.caminhos_da_versao()
+    caminho_indice, caminho_manifesto = caminhos[artefatos.NOME_INDICE], caminhos[artefatos.NOME_MANIFESTO]
+    if not os.path.exists(caminho_manifesto):
+        return None
+    if not os.path.exists(caminho_indice) and not all(os.path.exists(arq) for arq in [ARQUIVO_EMBEDDINGS, ARQUIVO_LABELS]):
+        return None
+    try:
+        with open(caminho_manifesto, 'r', encoding='utf-8') as f:
+            manifesto = json.load(f)
+        if manifesto.get('modelo') != identificacao_codificador() or manifesto.get('trechos') != [PALAVRAS_POR_TRECHO, MAX_TRECHOS_POR_DOCUMENTO]:
+            print("AVISO: O manifesto foi gerado com outro modelo ou outra divisão em trechos. Será feito um treinamento completo.")
+            return None
+        if os.path.exists(caminho_indice):
+            indice = IndiceEmbeddings.abrir(caminho_indice)
+            return indice.matriz_float32(), indice.labels, manifesto.get('layouts', {})
+        embeddings = np.asarray(joblib.load(ARQUIVO_EMBEDDINGS))
+        labels = list(joblib.load(ARQUIVO_LABELS))
+        if len(labels) != len(embeddings):
+            print("AVISO: Embeddings e labels existentes estão inconsistentes. Será feito um treinamento completo.")
+            return None
+        return embeddings, labels, manifesto.get('layouts', {})
+    except Exception as e:
+        print(f"AVISO: Não foi possível ler o modelo anterior ({e}). Será feito um treinamento completo.")
+        return None
+
+def _ler_trechos_do_cache(arquivos_por_layout, codigos):
+    # Um ou mais trechos por documento, já cortados no tamanho que o modelo aproveita.
+    labels, trechos = [], []
+    for codigo_layout in tqdm(codigos, desc="Lendo cache"):
+        for nome_arquivo_cache in sorted(arquivos_por_layout[codigo_layout]):
+            with open(os.path.join(PASTA_CACHE, nome_arquivo_cache), 'r', encoding='utf-8') as f:
+                trechos_documento = dividir_em_trechos(f.read())
+            labels.extend([codigo_layout] * len(trechos_documento))
+            trechos.extend(trechos_documento)
+    return labels, trechos
+
+def treinar_modelo_ml(incremental=False, tipo_indice=TIPO_INDICE):
     print("\n--- Etapa de Treinamento de Machine Learning (Usando Cache) ---")
-    textos_por_layout = defaultdict(str)
     if not os.path.exists(PASTA_CACHE):
         print("AVISO: Pasta de cache não encontrada. Pulando etapa de ML.")
         return
-    print("Lendo textos do cache para o treinamento...")
-    for nome_arquivo_cache in tqdm(os.listdir(PASTA_CACHE), desc="Lendo cache"):
-        nome_original = os.path.splitext(nome_arquivo_cache)[0]
-        match = re.search(r'\d+', nome_original)
-        if match:
-            codigo_layout = match.group(0)
-            with open(os.path.join(PASTA_CACHE, nome_arquivo_cache), 'r', encoding='utf-8') as f:
-                textos_por_layout[codigo_layout] += " " + f.read()
-    if not textos_por_layout:
+    arquivos_por_layout = _listar_cache_por_layout()
+    if not arquivos_por_layout:
         print("AVISO: Nenhum texto encontrado no cache para treinar. Modelos não serão atualizados.")
         return
-    labels = list(textos_por_layout.keys())
-    corpus = [textos_por_layout[label] for label in labels]
-    print("\nGerando embeddings semânticos...")
-    model = SentenceTransformer(NOME_MODELO_SEMANTICO)
-    embeddings = model.encode(corpus, show_progress_bar=True)
-    print("Salvando os arquivos do modelo de ML...")
-    joblib.dump(embeddings, ARQUIVO_EMBEDDINGS)
-    joblib.dump(labels, ARQUIVO_LABELS)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("model_version.txt", "w") as f:
-        f.write(timestamp)
+    assinaturas = {codigo: _assinatura_layout(nomes) for codigo, nomes in arquivos_por_layout.items()}
+    resumo = {'documentos': sum(len(nomes) for nomes in arquivos_por_layout.values()), 'layouts': len(arquivos_por_layout), 'layouts_recodificados': 0}
+
+    anterior = _carregar_modelo_anterior() if incremental else None
+    if anterior:
+        embeddings_anteriores, labels_anteriores, assinaturas_anteriores = anterior
+        codigos_anteriores = set(labels_anteriores)
+        alterados = [codigo for codigo in assinaturas if assinaturas_anteriores.get(codigo) != assinaturas[codigo] or codigo not in codigos_anteriores]
+        removidos = [codigo for codigo in codigos_anteriores if codigo not in assinaturas]
+        print(f"Modo incremental: {len(alterados)} layout(s) alterado(s), {len(removidos)} removido(s), "
+              f"{len(assinaturas) - len(alterados)} reaproveitado(s).")
+        if not alterados and not removidos:
+            print("Nenhuma alteração no cache desde o último treinamento. Modelos não serão atualizados.")
+            if _metadados_publicados_desatualizados():
+                resumo['versao'] = publicar_artefatos()
+            return resumo
+        descartados = set(alterados) | set(removidos)
+        linhas_mantidas = [i for i, codigo in enumerate(labels_anteriores) if codigo not in descartados]
+    else:
+        alterados = list(assinaturas.keys())
+        linhas_mantidas = []
+
+    print("Lendo textos do cache para o treinamento...")
+    labels_novos, corpus = _ler_trechos_do_cache(arquivos_por_layout, alterados)
+
+    if corpus:
+        print(f"\nGerando embeddings semânticos para {len(corpus)} trecho(s) de {len(set(labels_novos))} layout(s)...")
+        codificador = carregar_codificador()
+        print(f"Codificador: {codificador.identificacao}")
+        with metricas.medir('codificacao_corpus', backend=codificador.backend):
+            embeddings_novos = codificador.codificar(corpus, batch_size=TAMANHO_LOTE_ENCODE, mostrar_progresso=True)
+        metricas.incrementar('trechos_codificados', len(corpus))
+    else:
+        embeddings_novos = None
+
+    if anterior:
+        blocos = [embeddings_anteriores[linhas_mantidas]]
+        if embeddings_novos is not None: blocos.append(embeddings_novos)
+        embeddings = np.vstack(blocos)
+        labels = [labels_anteriores[i] for i in linhas_mantidas] + labels_novos
+    else:
+        embeddings, labels = embeddings_novos, labels_novos
+    if embeddings is None or len(labels) == 0:
+        print("AVISO: Nenhum embedding gerado. Modelos não serão atualizados.")
+        return
+
+    print(f"Salvando o índice de embeddings ({tipo_indice})...")
+    manifesto = {
+        'modelo': identificacao_codificador(),
+        'trechos': [PALAVRAS_POR_TRECHO, MAX_TRECHOS_POR_DOCUMENTO],
+        'layouts': {codigo: assinaturas[codigo] for codigo in set(labels)},
+    }
+    resumo['layouts_recodificados'] = len(alterados)
+    resumo['versao'] = publicar_artefatos(IndiceEmbeddings.de_matriz(embeddings, labels), tipo_indice, manifesto)
+    return resumo
+
+def publicar_artefatos(indice=None, tipo_indice=TIPO_INDICE, manifesto=None):
+    # Monta a versão completa numa pasta à parte e só então troca o ponteiro; o que não for
+    # passado aqui (ex.: o índice, numa atualização só de metadados) é herdado da versão atual.
+    versao, pasta = artefatos.preparar_versao()
+    try:
+        if indice is not None:
+            with metricas.medir('gravacao_indice', tipo=tipo_indice):
+                indice.salvar(os.path.join(pasta, artefatos.NOME_INDICE), tipo=tipo_indice)
+            if indice.linhas >= MIN_LINHAS_IVF:
+                # Catálogo grande: índice aproximado para a busca (catálogos menores ficam na busca exata).
+                print(f"Construindo o índice aproximado (IVF) para {indice.linhas} vetores...")
+                with metricas.medir('construcao_ivf'):
+                    IndiceIVF.construir(indice).salvar(os.path.join(pasta, artefatos.NOME_IVF))
+        if manifesto is not None:
+            with open(os.path.join(pasta, artefatos.NOME_MANIFESTO), 'w', encoding='utf-8') as f:
+                json.dump(manifesto, f, indent=4)
+        if os.path.exists(ARQUIVO_METADADOS):
+            shutil.copy2(ARQUIVO_METADADOS, os.path.join(pasta, artefatos.NOME_METADADOS))
+        artefatos.publicar_versao(versao, pasta)
+        return versao
+    except Exception as e:
+        shutil.rmtree(pasta, ignore_errors=True)
+        print(f"ERRO: Falha ao publicar a versão do modelo: {e}")
+        return None
+
+def _metadados_publicados_desatualizados():
+    _, caminhos = artefatos.caminhos_da_versao()
+    if not os.path.exists(caminhos[artefatos.NOME_INDICE]) or not os.path.exists(ARQUIVO_METADADOS):
+        return False
+    publicados = caminhos[artefatos.NOME_METADADOS]
+    return not os.path.exists(publicados) or not filecmp.cmp(ARQUIVO_METADADOS, publicados, shallow=False)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Treinador para o identificador de layouts.")
     parser.add_argument('--sincronizar-api', action='store_true', help="Apenas sincroniza a API para o arquivo Excel e atualiza os metadados.")
     parser.add_argument('--apenas-meta', action='store_true', help="Apenas atualiza os metadados a partir do Excel existente.")
-    parser.add_argument('--retreinar-rapido', action='store_true', help="Apenas retreina o modelo de ML a partir do cache de texto existente.")
+    parser.add_argument('--retreinar-rapido', action='store_true', help="Apenas retreina o modelo de ML a partir do cache de texto existente, recodificando só os layouts alterados.")
+    parser.add_argument('--completo', action='store_true', help="Recodifica todos os layouts, ignorando o manifesto do último treinamento.")
+    parser.add_argument('--apenas-cache', action='store_true', help="Apenas extrai para o cache os arquivos de treinamento novos ou alterados.")
+    parser.add_argument('--tipo-indice', choices=list(TIPOS_INDICE), default=TIPO_INDICE, help="Tipo numérico do índice de embeddings gravado em disco.")
+    parser.add_argument('--workers', type=int, default=None, help="Número de processos usados na extração do cache (padrão: número de CPUs).")
+    parser.add_argument('--resumo', default=None, help="Grava em JSON um resumo da execução (documentos, layouts, versão publicada), lido pela fila de treinamento.")
     args = parser.parse_args()
+    metricas.definir_processo('treinador')
+    resumo = {}
 
     if args.sincronizar_api:
         if sincronizar_mapeamento_com_api():
@@ -169,12 +488,23 @@ if __name__ == '__main__':
     elif args.apenas_meta:
         atualizar_metadados()
     elif args.retreinar_rapido:
-        treinar_modelo_ml()
+        # Sem extração, mas com a poda: layouts cujos arquivos foram apagados saem do índice.
+        # Só os arquivos com tamanho ou data alterados são lidos de novo para o hash.
+        podar_cache_de_texto()
+        resumo = treinar_modelo_ml(incremental=not args.completo, tipo_indice=args.tipo_indice) or {}
+    elif args.apenas_cache:
+        resumo['documentos_extraidos'] = gerar_cache_de_texto(max_workers=args.workers)
     else:
         sucesso_sinc = sincronizar_mapeamento_com_api()
         if sucesso_sinc:
-            mapa_final = atualizar_metadados()
+            # O cache vem antes dos metadados: os cabeçalhos saem da mesma extração que o texto.
+            extraidos = gerar_cache_de_texto(max_workers=args.workers)
+            mapa_final = atualizar_metadados(publicar=False)
             if mapa_final:
-                # A função treinar_modelo_ml agora é chamada sem argumentos
-                treinar_modelo_ml()
+                resumo = treinar_modelo_ml(incremental=not args.completo, tipo_indice=args.tipo_indice) or {}
+                resumo['documentos_extraidos'] = extraidos
+    metricas.registrar_resumo()
+    if args.resumo:
+        with open(args.resumo, 'w', encoding='utf-8') as f:
+            json.dump(resumo, f)
     print("\n--- Processo Concluído ---")
\ No newline at end of file